@@ -0,0 +1,33 @@
+"""
+    ArrayManager.update_bar 性能测试, 统计不同 size 下每秒能更新的K线数量.
+
+    在项目根目录运行: python -m backtest.bench_array_manager
+"""
+
+import time
+
+from backtest.bench_utils import make_bars
+from backtest.core import ArrayManager
+
+
+def bench_update_bar(bars, size) -> float:
+    """
+    先把 ArrayManager 填满, 再统计之后的 update_bar 耗时.
+    :param bars: K线, 数量需要大于 size
+    :param size: ArrayManager 的大小
+    :return: 每秒更新的K线数量
+    """
+    am = ArrayManager(size)
+    for bar in bars[:size]:
+        am.update_bar(bar)
+
+    start = time.perf_counter()
+    for bar in bars[size:]:
+        am.update_bar(bar)
+    return (len(bars) - size) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    bars = make_bars(25000)
+    for size in (100, 1050, 5000):
+        print('size=%5d: %8.0f 根/秒' % (size, bench_update_bar(bars, size)))
@@ -0,0 +1,39 @@
+"""
+    撮合性能测试, 统计挂着 N 个限价单和 N 个停止单时每根K线 check_order 的耗时.
+    挂单的价格远离行情, 一直不会成交, 测的是没有订单成交时撮合本身的开销.
+
+    在项目根目录运行: python -m backtest.bench_order_book
+"""
+
+import time
+
+from backtest.bench_utils import make_bars
+from backtest.core import Broker
+from backtest.core.order import Direction
+
+
+def bench_check_order(bars, count) -> float:
+    """
+    :param bars: K线
+    :param count: 限价单和停止单各自的数量, 买卖方向各一半
+    :return: 每根K线 check_order 的耗时, 微秒
+    """
+    broker = Broker()
+    broker.bar = bars[0]
+    for i in range(count // 2):
+        broker.active_orders.append(broker.create_order(100 + i * 1e-3, 1, Direction.LONG))
+        broker.active_orders.append(broker.create_order(1e5 + i, 1, Direction.SHORT))
+        broker.stop_orders.append(broker.create_order(1e5 + i, 1, Direction.COVER))
+        broker.stop_orders.append(broker.create_order(100 + i * 1e-3, 1, Direction.SELL))
+
+    start = time.perf_counter()
+    for bar in bars:
+        broker.bar = bar
+        broker.check_order(bar)
+    return (time.perf_counter() - start) / len(bars) * 1e6
+
+
+if __name__ == '__main__':
+    bars = make_bars(5000)
+    for count in (10, 100, 1000):
+        print('%4d 个限价单 + %4d 个停止单: %8.1f us/bar' % (count, count, bench_check_order(bars, count)))
@@ -0,0 +1,22 @@
+"""
+    性能测试脚本共用的工具函数.
+"""
+
+import numpy as np
+import pandas as pd
+
+from backtest.core import BarData
+
+
+def make_bars(count, seed=1):
+    """
+    随机游走生成的1分钟K线.
+    """
+    rng = np.random.default_rng(seed)
+    close = 3000 * np.exp(np.cumsum(rng.normal(0, 0.0015, count)))
+    open_price = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_price, close) * (1 + np.abs(rng.normal(0, 0.001, count)))
+    low = np.minimum(open_price, close) * (1 - np.abs(rng.normal(0, 0.001, count)))
+    volume = rng.integers(1, 1000, count).astype(np.float64)
+    times = pd.date_range('2021-05-01', periods=count, freq='1min')
+    return [BarData(*row) for row in zip(times, open_price, high, low, close, volume)]
@@ -1,4 +1,7 @@
 from .strategy import BaseStrategy
 from .broker import Broker
-from .data import BarData, TradeData
-from .array_manager import ArrayManager
+from .data import BarData, TickData, TradeData
+from .array_manager import ArrayManager, PrecomputedArrayManager
+from .arena import ArrayArena
+from .vectorized import vectorized_backtest
+from .journal import EventJournal, EventLevel, EventType
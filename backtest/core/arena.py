@@ -0,0 +1,183 @@
+"""
+    多个 ArrayManager 共用的一整块K线存储, 可以放在共享内存中, 子进程不拷贝地读取同一份行情窗口.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .array_manager import ArrayManager, NAT
+
+
+class SharedArrayManager(ArrayManager):
+    """
+    连接共享内存的只读 ArrayManager, 由 ArrayArena.array_manager 在子进程中创建.
+    K线数量和 head 每次都从共享的状态中读取, 创建方每次 sync 之后都能看到新的K线.
+    """
+
+    def __init__(self, state, size, dtype, buffer, ts_buffer):
+        """
+        :param state: 共享的 (K线数量, head)
+        """
+        self.state = state
+        super(SharedArrayManager, self).__init__(size, dtype, buffer=buffer, ts_buffer=ts_buffer)
+        # 增量指标和高周期K线最后一次更新时的K线数量
+        self.synced_count = self.count
+
+    @property
+    def count(self):
+        return int(self.state[0])
+
+    @count.setter
+    def count(self, value):
+        # 状态只由创建方写入, ArrayManager.__init__ 中的初始化赋值忽略
+        pass
+
+    @property
+    def head(self):
+        return int(self.state[1])
+
+    @head.setter
+    def head(self, value):
+        pass
+
+    @property
+    def inited(self):
+        return self.count >= self.size
+
+    @inited.setter
+    def inited(self, value):
+        pass
+
+    def update_bar(self, bar):
+        raise ValueError("连接共享内存的 ArrayManager 是只读的, 只能由创建方更新K线")
+
+    def update_bars(self, data):
+        raise ValueError("连接共享内存的 ArrayManager 是只读的, 只能由创建方更新K线")
+
+    def refresh(self):
+        """
+        创建方 sync 了新的K线后, 增量指标和高周期K线用当前窗口重新计算.
+        """
+        count = self.count
+        if count != self.synced_count:
+            self.streaming_indicators.clear()
+            for timeframe in self.timeframes.values():
+                timeframe.rebuild()
+            self.synced_count = count
+
+    def streaming(self, name, *args):
+        self.refresh()
+        return super(SharedArrayManager, self).streaming(name, *args)
+
+    def tf(self, rule):
+        self.refresh()
+        return super(SharedArrayManager, self).tf(rule)
+
+
+class ArrayArena(object):
+    """
+    为 count 个窗口长度为 size 的 ArrayManager 一次性分配存储:
+    prices 为 (count, 5, size * 2) 的价格和成交量, ts 为 (count, size * 2) 的时间戳,
+    state 为 (count, 2) 的 (K线数量, head), 由 sync 从 ArrayManager 写入.
+
+    shared 为 True 时存储放在共享内存中, 子进程用 ArrayArena.attach 按名称连接,
+    得到的 SharedArrayManager 直接读取共享内存, 只读, 创建方再次 sync 后可以看到新的K线.
+    """
+
+    def __init__(self, count, size=500, dtype=np.float64, shared=False, name=None):
+        """
+        :param count: ArrayManager 数量
+        :param size: K线窗口长度
+        :param dtype: 价格和成交量的存储类型
+        :param shared: 是否分配在共享内存中
+        :param name: 已有共享内存的名称, 不为 None 时连接该共享内存, 一般通过 attach 使用
+        """
+        self.count = count
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.shm = None
+        self.owner = name is None
+        self.managers = {}
+
+        prices_nbytes = count * 5 * size * 2 * self.dtype.itemsize
+        ts_nbytes = count * size * 2 * 8
+        # 每段按 8 字节对齐
+        ts_offset = (prices_nbytes + 7) // 8 * 8
+        state_offset = ts_offset + ts_nbytes
+        nbytes = state_offset + count * 2 * 8
+
+        if name is not None:
+            self.shm = shared_memory.SharedMemory(name=name)
+            buffer = self.shm.buf
+        elif shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            buffer = self.shm.buf
+        else:
+            buffer = bytearray(max(nbytes, 1))
+
+        self.prices = np.ndarray((count, 5, size * 2), dtype=self.dtype, buffer=buffer)
+        self.ts = np.ndarray((count, size * 2), dtype=np.int64, buffer=buffer, offset=ts_offset)
+        self.state = np.ndarray((count, 2), dtype=np.int64, buffer=buffer, offset=state_offset)
+
+        if self.owner:
+            self.prices[:] = 0
+            self.ts[:] = NAT
+            self.state[:] = (0, size - 1)
+        else:
+            for values in (self.prices, self.ts, self.state):
+                values.flags.writeable = False
+
+    @classmethod
+    def attach(cls, name, count, size=500, dtype=np.float64):
+        """
+        在子进程中连接共享内存中的存储.
+        """
+        return cls(count, size, dtype, name=name)
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    @property
+    def nbytes(self):
+        return self.prices.nbytes + self.ts.nbytes + self.state.nbytes
+
+    def array_manager(self, index) -> ArrayManager:
+        """
+        获取第 index 块存储上的 ArrayManager.
+        连接共享内存时返回只读的 SharedArrayManager, 状态总是创建方最后一次 sync 时的状态.
+        """
+        am = self.managers.get(index)
+        if am is None:
+            if self.owner:
+                am = ArrayManager(self.size, self.dtype, buffer=self.prices[index], ts_buffer=self.ts[index])
+            else:
+                am = SharedArrayManager(self.state[index], self.size, self.dtype, self.prices[index], self.ts[index])
+            self.managers[index] = am
+        return am
+
+    def sync(self):
+        """
+        把创建的 ArrayManager 的状态写入存储, 子进程连接之前调用.
+        """
+        for index, am in self.managers.items():
+            self.state[index] = (am.count, am.head)
+
+    def close(self):
+        """
+        释放存储, 共享内存由创建方删除. 关闭前需要先释放外部持有的 ArrayManager 引用.
+        """
+        self.managers.clear()
+        self.prices = self.ts = self.state = None
+        if self.shm is not None:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
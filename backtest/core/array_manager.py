@@ -2,10 +2,348 @@
 
 """
 
+import inspect
+from functools import wraps
+
 import numpy as np
 import talib
 from .data import BarData
+from .streaming import STREAMING_INDICATORS
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+# datetime64 中 NaT 的整数表示
+NAT = np.iinfo(np.int64).min
+
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+
+
+def kahan_sum(values, total=0.0, compensation=0.0):
+    """
+    补偿求和, 与 pandas groupby/resample 的 sum 算法一致, 保证成交量与 period() 的结果完全相同.
+    :return: (和, 补偿值)
+    """
+    for value in values:
+        y = value - compensation
+        t = total + y
+        compensation = t - total - y
+        total = t
+    return total, compensation
+
+
+def cached(func):
+    """
+    指标缓存, 同一根K线上相同参数的调用只计算一次, update_bar 之后缓存失效.
+    返回的数组是只读的, 避免调用方修改缓存中的结果.
+    """
+    name = func.__name__
+    signature = inspect.signature(func)
+    # 除 self 和 array 外的参数个数
+    count = len(signature.parameters) - 2
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        # 全部按位置传入时直接拆分, 否则按函数签名绑定, 保证 sma(20) 与 sma(n=20) 使用同一个缓存
+        if not kwargs and len(args) == count:
+            array = False
+        elif not kwargs and len(args) == count + 1:
+            args, array = args[:count], args[count]
+        else:
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            values = tuple(bound.arguments.values())
+            args, array = values[1:-1], values[-1]
+
+        if self.cache_count != self.count:
+            self.cache.clear()
+            self.cache_count = self.count
+
+        key = (name, args, bool(array))
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache_hits += 1
+            return result
+
+        self.cache_misses += 1
+        result = func(self, *args, array=array)
+        for value in (result if isinstance(result, tuple) else (result,)):
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        self.cache[key] = result
+        return result
+
+    return wrapper
+
+
+def as_float64(values: np.ndarray) -> np.ndarray:
+    """
+    talib 只接受 float64, 使用 float32 存储时转换一次.
+    """
+    return values if values.dtype == np.float64 else values.astype(np.float64)
+
+
+def bars_to_arrays(data):
+    """
+    把批量K线转换为 int64 纳秒时间戳数组和 (5, n) 的 open/high/low/close/volume 数组.
+    :param data: DataFrame 或 列名 -> 数组 的字典
+    """
+    open_time = np.asarray(data['open_time'])
+    if open_time.dtype.kind != 'M':
+        open_time = pd.to_datetime(open_time).to_numpy() if len(open_time) else open_time.astype('datetime64[ns]')
+    ts = open_time.astype('datetime64[ns]', copy=False).view(np.int64)
+    values = np.array([np.asarray(data[name], dtype=np.float64)
+                       for name in ('open', 'high', 'low', 'close', 'volume')]).reshape(5, len(ts))
+    return ts, values
+
+
+class FrameView(object):
+    """
+    ArrayManager 窗口数据的只读列式视图, 随 update_bar 自动更新.
+
+    frame.high 等属性返回缓冲区的只读切片, 不拷贝数据;
+    frame.last('high') 取最新值, frame.tail('high', n) 取最近 n 个值, 都不分配新数组;
+    只有调用 to_pandas 时才生成 DataFrame, 同一根K线上只生成一次.
+    """
+
+    ROWS = {'open': 0, 'high': 1, 'low': 2, 'close': 3, 'volume': 4}
+
+    def __init__(self, am):
+        self.am = am
+        self.size = am.size
+        self.values = am.buffer.view()
+        self.values.flags.writeable = False
+        self.open_time_values = am.open_time_buffer.view()
+        self.open_time_values.flags.writeable = False
+        self.df = None
+        self.df_count = -1
+
+    def column(self, name):
+        start = self.am.head + 1
+        if name == 'open_time':
+            return self.open_time_values[start:start + self.size]
+        return self.values[self.ROWS[name], start:start + self.size]
+
+    __getitem__ = column
+
+    def __getattr__(self, name):
+        if name in self.ROWS or name == 'open_time':
+            return self.column(name)
+        raise AttributeError(name)
+
+    def last(self, name):
+        """
+        最新值.
+        """
+        if name == 'open_time':
+            return self.open_time_values[self.am.head]
+        return self.values[self.ROWS[name], self.am.head]
+
+    def tail(self, name, n):
+        """
+        最近 n 个值, n 大于窗口大小时只返回整个窗口, 与 close_array[-n:] 相同.
+        """
+        n = min(n, self.size)
+        end = self.am.head + self.size + 1
+        if name == 'open_time':
+            return self.open_time_values[end - n:end]
+        return self.values[self.ROWS[name], end - n:end]
+
+    def __len__(self):
+        return self.size
+
+    def to_pandas(self) -> pd.DataFrame:
+        """
+        转换为 DataFrame, 结果在同一根K线上会被复用, 不要修改.
+        """
+        if self.df_count != self.am.count:
+            self.df = self.am.get_dataframe()
+            self.df_count = self.am.count
+        return self.df
+
+
+class TimeframeBars(object):
+    """
+    由 ArrayManager 中的K线增量合成的高周期K线, 结果与 period(am.get_dataframe(), rule, 'open_time') 一致:
+    1. 与 resample 默认的 origin='start_day' 相同, 周期从窗口第一根K线当天的零点开始对齐.
+       rule 能整除一天时对齐与日期无关; 不能整除时(比如 7T), 窗口起点跨过零点后按新的零点重新合成;
+    2. 第一个周期只包含仍在窗口中的K线, 最后一个周期是还没走完的K线;
+    3. 中间没有K线的周期价格为 NaN, 成交量为 0.
+
+    每根K线只更新最后一个周期, 第一个周期在读取时用窗口中剩余的K线重新计算.
+    """
+
+    def __init__(self, am, rule):
+        """
+        :param am: ArrayManager
+        :param rule: 时间周期, 比如 '5T', '1H'
+        """
+        self.am = am
+        self.rule = rule
+        self.ns = pd.Timedelta(to_offset(rule)).value
+        if self.ns <= 0:
+            raise ValueError(f"时间周期 {rule} 必须大于 0")
+        # 周期能整除一天时, 按任何一天的零点对齐结果都相同
+        self.aligned = DAY_NS % self.ns == 0
+        # 周期对齐的起点, 窗口第一根K线当天的零点
+        self.origin = 0
+
+        # 周期K线保存在 [start, end) 中, 写满后整体前移, 需要时扩容.
+        capacity = am.size + 1
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((5, capacity))
+        # 每个周期第一根K线的序号(ArrayManager.count), 空周期为下一根K线的序号
+        self.first = np.zeros(capacity, dtype=np.int64)
+        self.start = 0
+        self.end = 0
+        # 最后一个周期成交量的补偿值
+        self.compensation = 0.0
+
+    def append(self, ts, open_price, high_price, low_price, close_price, volume, first):
+        if self.end == len(self.ts):
+            live = self.end - self.start
+            capacity = len(self.ts) * 2 if live * 2 > len(self.ts) else len(self.ts)
+            ts_array = np.zeros(capacity, dtype=np.int64)
+            values = np.zeros((5, capacity))
+            first_array = np.zeros(capacity, dtype=np.int64)
+            ts_array[:live] = self.ts[self.start:self.end]
+            values[:, :live] = self.values[:, self.start:self.end]
+            first_array[:live] = self.first[self.start:self.end]
+            self.ts, self.values, self.first = ts_array, values, first_array
+            self.start, self.end = 0, live
+
+        end = self.end
+        self.ts[end] = ts
+        self.values[:, end] = (open_price, high_price, low_price, close_price, volume)
+        self.first[end] = first
+        self.end = end + 1
+
+    def update(self, count, ts, open_price, high_price, low_price, close_price, volume):
+        """
+        更新一根K线, 由 ArrayManager.update_bar 调用.
+        :param count: K线序号
+        """
+        if not self.aligned and self.window_origin() != self.origin:
+            # 窗口起点换了一天, 按新的零点重新合成, 已包含这根K线
+            self.rebuild()
+            return
+
+        bucket = ts - (ts - self.origin) % self.ns
+        end = self.end
+        if end > self.start:
+            last = end - 1
+            last_bucket = self.ts[last]
+            if bucket == last_bucket:
+                values = self.values
+                if high_price > values[1, last]:
+                    values[1, last] = high_price
+                if low_price < values[2, last]:
+                    values[2, last] = low_price
+                values[3, last] = close_price
+                values[4, last], self.compensation = kahan_sum((volume,), values[4, last], self.compensation)
+                return
+
+            # 补齐中间没有K线的周期
+            for empty in range(last_bucket + self.ns, bucket, self.ns):
+                self.append(empty, np.nan, np.nan, np.nan, np.nan, 0.0, count)
+
+        self.append(bucket, open_price, high_price, low_price, close_price, volume, count)
+        self.compensation = 0.0
+
+        # 丢弃已经全部移出窗口的周期
+        window_start = count - min(count, self.am.size) + 1
+        while self.start + 1 < self.end and self.first[self.start + 1] <= window_start:
+            self.start += 1
+
+    def window_origin(self):
+        """
+        窗口第一根K线当天的零点.
+        """
+        am = self.am
+        if not am.count:
+            return self.origin
+        ts = int(am.ts_buffer[am.head + 1 + am.size - min(am.count, am.size)])
+        return self.origin if ts == NAT else ts - ts % DAY_NS
+
+    def rebuild(self):
+        """
+        用 ArrayManager 窗口中的K线重新合成.
+        """
+        am = self.am
+        self.start = self.end = 0
+        self.compensation = 0.0
+        self.origin = self.window_origin()
+        for i in range(am.size - min(am.count, am.size), am.size):
+            ts = int(am.ts_buffer[am.head + 1 + i])
+            if ts != NAT:
+                self.update(am.count - (am.size - 1 - i), ts, *am.buffer[:, am.head + 1 + i].tolist())
+
+    def sync(self):
+        """
+        窗口起点落在第一个周期中间时, 用窗口中剩余的K线重新计算第一个周期.
+        """
+        am = self.am
+        window_start = am.count - min(am.count, am.size) + 1
+        while self.start + 1 < self.end and self.first[self.start + 1] <= window_start:
+            self.start += 1
+
+        start = self.start
+        if start == self.end or self.first[start] >= window_start:
+            return
+
+        last = self.first[start + 1] if start + 1 < self.end else am.count + 1
+        begin = am.size - (am.count - window_start) - 1
+        stop = am.size - (am.count - last) - 1
+        high = am.high_array[begin:stop]
+        low = am.low_array[begin:stop]
+        volume, compensation = kahan_sum(am.volume_array[begin:stop].tolist())
+        self.values[:, start] = (am.open_array[begin], high.max(), low.min(), am.close_array[stop - 1], volume)
+        self.first[start] = window_start
+        if start + 1 == self.end:
+            self.compensation = compensation
+
+    def column(self, row):
+        self.sync()
+        values = self.values[row, self.start:self.end]
+        values.flags.writeable = False
+        return values
+
+    @property
+    def open(self):
+        return self.column(0)
+
+    @property
+    def high(self):
+        return self.column(1)
+
+    @property
+    def low(self):
+        return self.column(2)
+
+    @property
+    def close(self):
+        return self.column(3)
+
+    @property
+    def volume(self):
+        return self.column(4)
+
+    @property
+    def open_time(self):
+        self.sync()
+        return self.ts[self.start:self.end].view('datetime64[ns]')
+
+    def __len__(self):
+        return self.end - self.start
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        转换为与 period() 结果相同格式的 DataFrame, 以 open_time 为索引.
+        """
+        self.sync()
+        index = pd.DatetimeIndex(self.open_time, name='open_time')
+        return pd.DataFrame(self.values[:, self.start:self.end].T.copy(),
+                            columns=['open', 'high', 'low', 'close', 'volume'], index=index)
 
 
 class ArrayManager(object):
@@ -15,18 +353,52 @@ class ArrayManager(object):
     2. calculating technical indicator value
     """
 
-    def __init__(self, size=500):
-        """Constructor"""
+    def __init__(self, size=500, dtype=np.float64, buffer: np.ndarray = None, ts_buffer: np.ndarray = None):
+        """
+        :param size: K线窗口长度
+        :param dtype: 价格和成交量的存储类型, float32 节省一半内存, 计算 talib 指标时转换为 float64
+        :param buffer: 外部分配的 (5, size * 2) 价格存储, 比如 ArrayArena 中的一块, None 表示自己分配
+        :param ts_buffer: 外部分配的 size * 2 个 int64 时间戳存储, 与 buffer 一起传入
+
+        每个实例的存储为 size * 2 * (5 * dtype 字节数 + 8) 字节, size=1050 时
+        float64 约 101KB, float32 约 59KB, 另有 Python 对象本身的少量开销.
+        """
         self.count = 0
         self.size = size
         self.inited = False
 
-        self.open_array = np.zeros(size)
-        self.high_array = np.zeros(size)
-        self.low_array = np.zeros(size)
-        self.close_array = np.zeros(size)
-        self.volume_array = np.zeros(size)
-        self.open_time_array = [None]*size
+        # 双倍长度的镜像环形缓冲区, 每根K线同时写入 head 和 head + size 两个位置,
+        # buffer[:, head + 1: head + 1 + size] 始终是按时间排序的连续窗口, 追加新K线是 O(1) 的.
+        # 行依次为 open, high, low, close, volume.
+        if buffer is None:
+            buffer = np.zeros((5, size * 2), dtype=dtype)
+            ts_buffer = np.full(size * 2, NAT, dtype=np.int64)
+        self.buffer = buffer
+        # 时间戳直接写入 int64 的 ts_buffer, open_time_buffer 是它的 datetime64 视图
+        self.ts_buffer = ts_buffer
+        self.open_time_buffer = ts_buffer.view('datetime64[ns]')
+        self.head = size - 1
+
+        # 增量指标, (名称, 参数) -> StreamingIndicator
+        self.streaming_indicators = {}
+
+        # 指标缓存, (方法名, 参数, array) -> 结果, 只在 cache_count 这根K线上有效
+        self.cache = {}
+        self.cache_count = -1
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.frame = FrameView(self)
+
+        # 高周期K线, 时间周期 -> TimeframeBars
+        self.timeframes = {}
+
+    @property
+    def nbytes(self):
+        """
+        K线存储占用的字节数.
+        """
+        return self.buffer.nbytes + self.ts_buffer.nbytes
 
     def update_bar(self, bar: BarData):
         """
@@ -36,58 +408,165 @@ class ArrayManager(object):
         if not self.inited and self.count >= self.size:
             self.inited = True
 
-        # [1,2,3,4,5,6,7,8,9,10]
-        # [1,2,3,4,5,6,7,8,9] = [2,3,4,5,6,7,8,9,10]
-        # [2,3,4,5,6,7,8,9,10, 10]
-        self.open_array[:-1] = self.open_array[1:]
-        self.high_array[:-1] = self.high_array[1:]
-        self.low_array[:-1] = self.low_array[1:]
-        self.close_array[:-1] = self.close_array[1:]
-        self.volume_array[:-1] = self.volume_array[1:]
-        self.open_time_array[:-1] = self.open_time_array[1:]
-
-        # [2,3,4,5,6,7,8,9,10, 10] 然后最后一个数字被替换了.
-        self.open_array[-1] = bar.open_price
-        self.high_array[-1] = bar.high_price
-        self.low_array[-1] = bar.low_price
-        self.close_array[-1] = bar.close_price
-        self.volume_array[-1] = bar.volume
-        self.open_time_array[-1] = bar.datetime
+        head = self.head + 1
+        if head == self.size:
+            head = 0
+        self.head = head
+
+        values = (bar.open_price, bar.high_price, bar.low_price, bar.close_price, bar.volume)
+        self.buffer[:, head] = values
+        self.buffer[:, head + self.size] = values
+        ts = bar.ts if bar.ts is not None else NAT
+        self.ts_buffer[head] = ts
+        self.ts_buffer[head + self.size] = ts
+
+        for indicator in self.streaming_indicators.values():
+            indicator.update(*values)
+
+        if ts != NAT:
+            for timeframe in self.timeframes.values():
+                timeframe.update(self.count, ts, *values)
+
+    def update_bars(self, data):
+        """
+        批量更新K线, 结果与逐根调用 update_bar 完全相同, 用于预热历史数据.
+        窗口数据一次性拷贝, 只有已注册的增量指标和高周期K线需要逐根更新.
+        :param data: DataFrame 或 列名 -> 数组 的字典, 包含 open_time/open/high/low/close/volume
+        """
+        ts, values = bars_to_arrays(data)
+        n = len(ts)
+        if not n:
+            return
+
+        size = self.size
+        # 更新后的窗口: 旧窗口中保留的部分 + 新K线中的最后 size 根
+        length = min(n, size)
+        window = np.empty((5, size))
+        window_ts = np.empty(size, dtype=np.int64)
+        window[:, :size - length] = self.buffer[:, self.head + 1 + length:self.head + 1 + size]
+        window_ts[:size - length] = self.ts_buffer[self.head + 1 + length:self.head + 1 + size]
+        window[:, size - length:] = values[:, n - length:]
+        window_ts[size - length:] = ts[n - length:]
+
+        self.head = (self.head + n) % size
+        positions = (self.head + 1 + np.arange(size)) % size
+        self.buffer[:, positions] = window
+        self.buffer[:, positions + size] = window
+        self.ts_buffer[positions] = window_ts
+        self.ts_buffer[positions + size] = window_ts
+
+        self.count += n
+        if not self.inited and self.count >= size:
+            self.inited = True
+
+        for indicator in self.streaming_indicators.values():
+            indicator.seed(*values)
+
+        # 高周期K线只需要窗口中的K线
+        for timeframe in self.timeframes.values():
+            timeframe.rebuild()
+
+    @property
+    def open_array(self):
+        return self.buffer[0, self.head + 1:self.head + 1 + self.size]
+
+    @property
+    def high_array(self):
+        return self.buffer[1, self.head + 1:self.head + 1 + self.size]
+
+    @property
+    def low_array(self):
+        return self.buffer[2, self.head + 1:self.head + 1 + self.size]
+
+    @property
+    def close_array(self):
+        return self.buffer[3, self.head + 1:self.head + 1 + self.size]
+
+    @property
+    def volume_array(self):
+        return self.buffer[4, self.head + 1:self.head + 1 + self.size]
+
+    @property
+    def open_time_array(self):
+        return self.open_time_buffer[self.head + 1:self.head + 1 + self.size]
 
     @property
     def open(self):
         """
         Get open price time series.
         """
-        return self.open_array
+        return as_float64(self.open_array)
 
     @property
     def high(self):
         """
         Get high price time series.
         """
-        return self.high_array
+        return as_float64(self.high_array)
 
     @property
     def low(self):
         """
         Get low price time series.
         """
-        return self.low_array
+        return as_float64(self.low_array)
 
     @property
     def close(self):
         """
         Get close price time series.
         """
-        return self.close_array
+        return as_float64(self.close_array)
 
     @property
     def volume(self):
         """
         Get trading volume time series.
         """
-        return self.volume_array
+        return as_float64(self.volume_array)
+
+    def streaming(self, name, *args):
+        """
+        获取增量指标的最新值, 每根K线的更新是 O(1) 的, 适合每根K线都要读取最新值的指标.
+        第一次获取时用窗口中已有的K线初始化, 之后随 update_bar 更新.
+        :param name: 指标名称, sma/std/ema/macd/atr/rsi/adx/donchian
+        :param args: 指标参数, 与同名方法的参数一致
+        :return: 指标的最新值, macd 为 (macd, signal, hist), donchian 为 (up, down)
+        """
+        key = (name, args)
+        indicator = self.streaming_indicators.get(key)
+        if indicator is None:
+            indicator = STREAMING_INDICATORS[name](*args)
+            length = min(self.count, self.size)
+            if length:
+                indicator.seed(self.open_array[-length:], self.high_array[-length:], self.low_array[-length:],
+                               self.close_array[-length:], self.volume_array[-length:])
+            self.streaming_indicators[key] = indicator
+        return indicator.value
+
+    def tf(self, rule) -> TimeframeBars:
+        """
+        获取高周期K线, 第一次获取时用窗口中已有的K线初始化, 之后随 update_bar 增量更新.
+        :param rule: 时间周期, 比如 '5T', '7T', '30T', '1H'
+        :return: TimeframeBars, open/high/low/close/volume/open_time 为数组, to_dataframe 转换为 DataFrame
+        """
+        timeframe = self.timeframes.get(rule)
+        if timeframe is None:
+            timeframe = TimeframeBars(self, rule)
+            timeframe.rebuild()
+            self.timeframes[rule] = timeframe
+        return timeframe
+
+    def cache_info(self):
+        """
+        指标缓存的命中统计.
+        """
+        total = self.cache_hits + self.cache_misses
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': self.cache_hits / total if total else 0.0,
+        }
 
     def get_dataframe(self) -> pd.DataFrame:
         """
@@ -104,6 +583,7 @@ class ArrayManager(object):
         df['open_time'] = self.open_time_array
         return df
 
+    @cached
     def sma(self, n, array=False):
         """
         Simple moving average.
@@ -113,6 +593,7 @@ class ArrayManager(object):
             return result
         return result[-1]
 
+    @cached
     def std(self, n, array=False):
         """
         Standard deviation
@@ -122,6 +603,7 @@ class ArrayManager(object):
             return result
         return result[-1]
 
+    @cached
     def cci(self, n, array=False):
         """
         Commodity Channel Index (CCI).
@@ -131,6 +613,7 @@ class ArrayManager(object):
             return result
         return result[-1]
 
+    @cached
     def atr(self, n, array=False):
         """
         Average True Range (ATR).
@@ -140,6 +623,7 @@ class ArrayManager(object):
             return result
         return result[-1]
 
+    @cached
     def rsi(self, n, array=False):
         """
         Relative Strenght Index (RSI).
@@ -149,6 +633,7 @@ class ArrayManager(object):
             return result
         return result[-1]
 
+    @cached
     def macd(self, fast_period, slow_period, signal_period, array=False):
         """
         MACD.
@@ -160,6 +645,7 @@ class ArrayManager(object):
             return macd, signal, hist
         return macd[-1], signal[-1], hist[-1]
 
+    @cached
     def adx(self, n, array=False):
         """
         ADX.
@@ -169,6 +655,7 @@ class ArrayManager(object):
             return result
         return result[-1]
 
+    @cached
     def boll(self, n, dev, array=False):
         """
         Bollinger Channel.
@@ -181,6 +668,7 @@ class ArrayManager(object):
 
         return up, down
 
+    @cached
     def keltner(self, n, dev, array=False):
         """
         Keltner Channel.
@@ -193,6 +681,7 @@ class ArrayManager(object):
 
         return up, down
 
+    @cached
     def donchian(self, n, array=False):
         """
         Donchian Channel.
@@ -203,3 +692,103 @@ class ArrayManager(object):
         if array:
             return up, down
         return up[-1], down[-1]
+
+
+class PrecomputedArrayManager(ArrayManager):
+    """
+    回测用的 ArrayManager, 回测数据事先已知, 指标在第一次调用时对全部回测数据计算一次,
+    之后每根K线只按当前K线的位置取值, 不再对滑动窗口重复计算.
+
+    防止未来函数:
+    1. update_bar 只接受按顺序到来的回测数据中的K线, 当前位置始终是最新一根已更新的K线;
+    2. 指标只返回当前位置及之前的值, array=True 时返回截止到当前位置、长度不超过 size 的只读拷贝,
+       不是全部结果的视图, 不能通过 .base 读到之后的值;
+    3. 全部回测数据和全部指标结果保存在私有属性中, 不对策略公开.
+
+    talib 的指标只依赖当前及之前的数据, 所以与滑动窗口的结果相同, 只是 EMA 类指标不会在窗口起点重新初始化,
+    与窗口计算的结果只有可以忽略的差别. K线窗口、frame、tf、streaming 与 ArrayManager 相同.
+    """
+
+    def __init__(self, data: pd.DataFrame, size=500):
+        """
+        :param data: 全部回测数据, 与 Broker 的回测数据相同
+        :param size: K线窗口长度
+        """
+        super(PrecomputedArrayManager, self).__init__(size)
+        self._history = {name: data[name].to_numpy(dtype=np.float64)
+                        for name in ('open', 'high', 'low', 'close', 'volume')}
+        self._history_ts = pd.to_datetime(data['open_time']).to_numpy().view(np.int64)
+        # (指标名称, 参数) -> 全部回测数据上的指标结果
+        self._indicators = {}
+
+    def update_bar(self, bar: BarData):
+        if self.count >= len(self._history_ts) or bar.ts != self._history_ts[self.count]:
+            raise ValueError("PrecomputedArrayManager 只能按顺序更新回测数据中的K线..")
+        super(PrecomputedArrayManager, self).update_bar(bar)
+
+    def update_bars(self, data):
+        ts, _ = bars_to_arrays(data)
+        if not np.array_equal(ts, self._history_ts[self.count:self.count + len(ts)]):
+            raise ValueError("PrecomputedArrayManager 只能按顺序更新回测数据中的K线..")
+        super(PrecomputedArrayManager, self).update_bars(data)
+
+    def _indicator(self, name, args, func):
+        """
+        获取全部回测数据上的指标结果, 只计算一次.
+        """
+        key = (name, args)
+        result = self._indicators.get(key)
+        if result is None:
+            result = func(*args)
+            for value in (result if isinstance(result, tuple) else (result,)):
+                value.flags.writeable = False
+            self._indicators[key] = result
+        return result
+
+    def value_at(self, result, array):
+        """
+        取当前位置的指标值, array 为 True 时取截止到当前位置的数组.
+        """
+        end = self.count
+        if array:
+            values = result[max(end - self.size, 0):end].copy()
+            values.flags.writeable = False
+            return values
+        return result[end - 1] if end else np.nan
+
+    def sma(self, n, array=False):
+        result = self._indicator('sma', (n,), lambda n: talib.SMA(self._history['close'], n))
+        return self.value_at(result, array)
+
+    def std(self, n, array=False):
+        result = self._indicator('std', (n,), lambda n: talib.STDDEV(self._history['close'], n))
+        return self.value_at(result, array)
+
+    def cci(self, n, array=False):
+        h = self._history
+        result = self._indicator('cci', (n,), lambda n: talib.CCI(h['high'], h['low'], h['close'], n))
+        return self.value_at(result, array)
+
+    def atr(self, n, array=False):
+        h = self._history
+        result = self._indicator('atr', (n,), lambda n: talib.ATR(h['high'], h['low'], h['close'], n))
+        return self.value_at(result, array)
+
+    def rsi(self, n, array=False):
+        result = self._indicator('rsi', (n,), lambda n: talib.RSI(self._history['close'], n))
+        return self.value_at(result, array)
+
+    def macd(self, fast_period, slow_period, signal_period, array=False):
+        result = self._indicator('macd', (fast_period, slow_period, signal_period),
+                                 lambda *args: talib.MACD(self._history['close'], *args))
+        return tuple(self.value_at(values, array) for values in result)
+
+    def adx(self, n, array=False):
+        h = self._history
+        result = self._indicator('adx', (n,), lambda n: talib.ADX(h['high'], h['low'], h['close'], n))
+        return self.value_at(result, array)
+
+    def donchian(self, n, array=False):
+        h = self._history
+        result = self._indicator('donchian', (n,), lambda n: (talib.MAX(h['high'], n), talib.MIN(h['low'], n)))
+        return tuple(self.value_at(values, array) for values in result)
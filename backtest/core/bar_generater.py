@@ -1,7 +1,172 @@
 from typing import Callable, Dict
 
-from backtest.core import BarData
+import numpy as np
+import pandas as pd
+
+from backtest.core import BarData, TickData
+from backtest.core.array_manager import bars_to_arrays
 from backtest.core.constant import Interval
+from common.time_utils import timestamps_to_datetimes
+
+# 纳秒时间戳的时间单位
+MINUTE_NS = 60 * 10 ** 9
+HOUR_NS = 60 * MINUTE_NS
+
+
+def window_length(window: int, interval: Interval) -> int:
+    """
+    周期长度, 纳秒.
+    """
+    if interval == Interval.MINUTE:
+        return window * MINUTE_NS
+    if interval == Interval.HOUR:
+        return window * HOUR_NS
+    raise ValueError(f"不支持的K线周期: {interval}")
+
+
+def sequential_sum(values: np.ndarray, starts: np.ndarray, long_segment=64) -> np.ndarray:
+    """
+    分段按顺序求和, 与逐个 += 的结果完全相同 (np.add.reduceat 对长分段使用成对求和, 结果可能有舍入差别).
+    长度超过 long_segment 的分段逐段用 np.cumsum 求和, np.cumsum 严格按顺序累加;
+    其余分段按长度从长到短排列, 第 j 步把所有长度大于 j 的分段的第 j 个值加上去, 最多 long_segment 步.
+    :param values: 数据
+    :param starts: 每个分段的起始位置
+    :param long_segment: 逐段求和的分段长度下限
+    """
+    counts = np.diff(np.r_[starts, len(values)])
+    totals = np.empty(len(starts))
+
+    long = np.flatnonzero(counts > long_segment)
+    for i in long.tolist():
+        start = starts[i]
+        totals[i] = np.cumsum(values[start:start + counts[i]], dtype=np.float64)[-1]
+
+    short = np.flatnonzero(counts <= long_segment)
+    if not len(short):
+        return totals
+    order = short[np.argsort(-counts[short], kind='stable')]
+    sorted_starts = starts[order]
+    sorted_counts = counts[order]
+
+    short_totals = values[sorted_starts].astype(np.float64)
+    # 长度大于 j 的分段数量
+    active = np.searchsorted(-sorted_counts, -np.arange(1, sorted_counts[0] + 1), side='right')
+    for j in range(1, len(active)):
+        k = active[j]
+        short_totals[:k] += values[sorted_starts[:k] + j]
+
+    totals[order] = short_totals
+    return totals
+
+
+def aggregate_bars(ts: np.ndarray, values: np.ndarray, length: int):
+    """
+    把按时间排序的 1 分钟K线按时间戳对齐的周期聚合, 没有K线的周期不输出.
+    成交量按时间顺序逐根相加, 与 BarGenerator.update_bar 的结果完全相同.
+    :param ts: int64 纳秒时间戳
+    :param values: (5, n) 的 open/high/low/close/volume
+    :param length: 周期长度, 纳秒
+    :return: (周期开始时间戳, (5, m) 的周期K线, 每个周期是否已经走完)
+    """
+    n = len(ts)
+    if not n:
+        return ts[:0], values[:, :0], np.zeros(0, dtype=bool)
+
+    buckets = ts - ts % length
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+
+    bars = np.array([
+        values[0, starts],
+        np.maximum.reduceat(values[1], starts),
+        np.minimum.reduceat(values[2], starts),
+        values[3, ends],
+        sequential_sum(values[4], starts),
+    ])
+    # 最后一根K线是周期的最后一分钟, 或者后面已经有下一个周期的K线
+    finished = np.r_[np.ones(len(starts) - 1, dtype=bool), ts[-1] + MINUTE_NS >= buckets[-1] + length]
+    return buckets[starts], bars, finished
+
+
+def generate_bars(data, window: int, interval: Interval = Interval.MINUTE) -> pd.DataFrame:
+    """
+    把 1 分钟K线一次性合成 x 分钟 / x 小时K线, 最后一个周期可能没有走完.
+    :param data: DataFrame 或 列名 -> 数组 的字典, 包含 open_time/open/high/low/close/volume
+    :param window: 周期数
+    :param interval: 周期单位
+    :return: open_time/open/high/low/close/volume 的 DataFrame, open_time 为周期开始时间
+    """
+    ts, values = bars_to_arrays(data)
+    starts, bars, _ = aggregate_bars(ts, values, window_length(window, interval))
+    return pd.DataFrame({
+        'open_time': starts.view('datetime64[ns]'),
+        'open': bars[0],
+        'high': bars[1],
+        'low': bars[2],
+        'close': bars[3],
+        'volume': bars[4],
+    })
+
+
+def aggregate_ticks(ts: np.ndarray, price: np.ndarray, volume: np.ndarray):
+    """
+    把按时间排序的逐笔成交聚合为 1 分钟K线, 没有成交的分钟不输出.
+    :param ts: int64 纳秒时间戳
+    :param price: 成交价格
+    :param volume: 成交数量
+    :return: (K线开始时间戳, (5, m) 的 open/high/low/close/volume)
+    """
+    n = len(ts)
+    if not n:
+        return ts[:0], np.zeros((5, 0))
+
+    minutes = ts - ts % MINUTE_NS
+    starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    bars = np.array([
+        price[starts],
+        np.maximum.reduceat(price, starts),
+        np.minimum.reduceat(price, starts),
+        price[ends],
+        sequential_sum(volume, starts),
+    ], dtype=np.float64)
+    return minutes[starts], bars
+
+
+def ticks_to_arrays(ts, price, volume, unit='ms'):
+    """
+    把成交时间转换为本地时间的 int64 纳秒时间戳.
+    整数时间戳与 load_klines 一样按本地时区转换, 保留秒以下的部分; datetime64 视为已经是本地时间.
+    """
+    ts = np.asarray(ts)
+    if ts.dtype.kind == 'M':
+        ts = ts.astype('datetime64[ns]', copy=False).view(np.int64)
+    else:
+        ts = ts.astype(np.int64)
+        divisor = {'s': 1, 'ms': 1000, 'us': 1000_000, 'ns': 1000_000_000}[unit]
+        ts = timestamps_to_datetimes(ts, unit).view(np.int64) + ts % divisor * (1000_000_000 // divisor)
+    return ts, np.asarray(price, dtype=np.float64), np.asarray(volume, dtype=np.float64)
+
+
+def ticks_to_bars(ts, price, volume, unit='ms') -> pd.DataFrame:
+    """
+    把逐笔成交一次性合成 1 分钟K线, 可以直接作为回测数据或交给 ArrayManager.update_bars.
+    最后一分钟可能还没有走完.
+    :param ts: 成交时间, 本地时间的 datetime64 或交易所的整数时间戳, 按时间排序
+    :param price: 成交价格
+    :param volume: 成交数量
+    :param unit: 整数时间戳的单位, 's' / 'ms' / 'us' / 'ns', 转换为本地时间, 与 load_klines 读取的K线一致
+    :return: open_time/open/high/low/close/volume 的 DataFrame
+    """
+    starts, bars = aggregate_ticks(*ticks_to_arrays(ts, price, volume, unit))
+    return pd.DataFrame({
+        'open_time': starts.view('datetime64[ns]'),
+        'open': bars[0],
+        'high': bars[1],
+        'low': bars[2],
+        'close': bars[3],
+        'volume': bars[4],
+    })
 
 
 class BarGenerator:
@@ -11,82 +176,221 @@ class BarGenerator:
     2. generateing x minute bar/x hour bar data from 1 minute data
 
     Notice:
-    1. for x minute bar, x must be able to divide 60: 2, 3, 5, 6, 10, 15, 20, 30
-    2. for x hour bar, x can be any number
+    1. windows are aligned on timestamps: a x minute bar starts at a multiple of x minutes since the epoch,
+       so x should divide 60 (2, 3, 5, 6, 10, 15, 20, 30) to start at the same minutes every hour,
+       and a x hour bar starts at a multiple of x hours, x should divide 24.
+    2. a window bar is finished on its last minute, or when a bar of a later window arrives,
+       so missing minutes never merge two windows.
     """
 
     def __init__(
             self,
             window: int = 0,
             on_window_bar: Callable = None,
-            interval: Interval = Interval.MINUTE
+            interval: Interval = Interval.MINUTE,
+            on_bar: Callable = None
     ):
-        """Constructor"""
+        """
+        :param window: 周期数, 只合成 1 分钟K线时可以为 0
+        :param on_window_bar: 周期K线结束时的回调
+        :param interval: 周期单位
+        :param on_bar: 由逐笔成交合成的 1 分钟K线结束时的回调
+        """
+        # 由逐笔成交合成中的 1 分钟K线
         self.bar = None
+        self.on_bar = on_bar
 
         self.interval = interval
-        self.interval_count = 0
+        self.length = window_length(window, interval) if window else 0
 
         self.window = window
         self.window_bar = None
         self.on_window_bar = on_window_bar
 
-        self.last_bar = None
+        self.last_ts = None
+
+    def update_tick(self, tick: TickData):
+        """
+        Update tick data into generator, 1 分钟K线在下一分钟的第一笔成交到来时结束.
+        """
+        ts = tick.ts
+        minute = ts - ts % MINUTE_NS
+
+        if self.bar and self.bar.ts != minute:
+            self.finish_bar()
+
+        if not self.bar:
+            self.bar = BarData(minute, tick.price, tick.price, tick.price, tick.price, tick.volume)
+        else:
+            if tick.price > self.bar.high_price:
+                self.bar.high_price = tick.price
+            if tick.price < self.bar.low_price:
+                self.bar.low_price = tick.price
+            self.bar.close_price = tick.price
+            self.bar.volume += tick.volume
+
+    def update_ticks(self, ts, price, volume, unit='ms'):
+        """
+        批量更新逐笔成交, 回调和结果与逐笔调用 update_tick 相同, 最后一分钟保留在 self.bar 中.
+        :param ts: 成交时间, 本地时间的 datetime64 或交易所的整数时间戳, 按时间排序
+        :param price: 成交价格
+        :param volume: 成交数量
+        :param unit: 整数时间戳的单位, 's' / 'ms' / 'us' / 'ns', 转换为本地时间, 与 load_klines 读取的K线一致
+        """
+        ts, price, volume = ticks_to_arrays(ts, price, volume, unit)
+        if not len(ts):
+            return
+
+        # 属于当前未完成的 1 分钟K线的成交逐笔更新
+        i = 0
+        if self.bar:
+            i = int(np.searchsorted(ts, self.bar.ts + MINUTE_NS))
+            for tick in zip(ts[:i].tolist(), price[:i].tolist(), volume[:i].tolist()):
+                self.update_tick(TickData(*tick))
+            if i < len(ts):
+                self.finish_bar()
+
+        starts, bars = aggregate_ticks(ts[i:], price[i:], volume[i:])
+        for start, bar in zip(starts.tolist(), bars.T.tolist()):
+            if self.bar:
+                self.finish_bar()
+            self.bar = BarData(start, *bar)
+
+    def finish_bar(self):
+        bar, self.bar = self.bar, None
+        if self.on_bar:
+            self.on_bar(bar)
 
     def update_bar(self, bar: BarData):
         """
         Update 1 minute bar into generator
         """
+        ts = bar.ts
+        start = ts - ts % self.length
+
+        # 有缺失的K线时, 上一个周期在下一个周期的K线到来时结束
+        if self.window_bar and self.window_bar.ts != start:
+            self.finish_window_bar()
+
         # If not inited, create window bar object
         if not self.window_bar:
-            # Generate timestamp for bar data
-            if self.interval == Interval.MINUTE:
-                dt = bar.datetime.replace(second=0, microsecond=0)
-            else:
-                dt = bar.datetime.replace(minute=0, second=0, microsecond=0)
-
             self.window_bar = BarData(
-                datetime=dt,
+                datetime=start,
                 open_price=bar.open_price,
                 high_price=bar.high_price,
                 low_price=bar.low_price,
                 close_price=bar.close_price,
                 volume=bar.volume
             )
-        # Otherwise, update high/low price into window bar
+        # Otherwise, update high/low price, close price and volume into window bar
         else:
             self.window_bar.high_price = max(
                 self.window_bar.high_price, bar.high_price)
             self.window_bar.low_price = min(
                 self.window_bar.low_price, bar.low_price)
-
-        # Update close price/volume into window bar
-        self.window_bar.close_price = bar.close_price
-        self.window_bar.volume += int(bar.volume)
+            self.window_bar.close_price = bar.close_price
+            self.window_bar.volume += bar.volume
 
         # Check if window bar completed
-        finished = False
-
-        if self.interval == Interval.MINUTE:
-            # x-minute bar
-            if not (bar.datetime.minute + 1) % self.window:
-                finished = True
-        elif self.interval == Interval.HOUR:
-            if self.last_bar and bar.datetime.hour != self.last_bar.datetime.hour:
-                # 1-hour bar
-                if self.window == 1:
-                    finished = True
-                # x-hour bar
-                else:
-                    self.interval_count += 1
-
-                    if not self.interval_count % self.window:
-                        finished = True
-                        self.interval_count = 0
+        if ts + MINUTE_NS >= start + self.length:
+            self.finish_window_bar()
 
-        if finished:
-            self.on_window_bar(self.window_bar)
-            self.window_bar = None
+        # Cache last bar timestamp, the bar object itself may be reused by the feed
+        self.last_ts = ts
+
+    def update_bars(self, data):
+        """
+        批量更新 1 分钟K线, 回调和结果与逐根调用 update_bar 相同.
+        :param data: DataFrame 或 列名 -> 数组 的字典, 包含 open_time/open/high/low/close/volume
+        """
+        ts, values = bars_to_arrays(data)
+        if not len(ts):
+            return
+
+        # 属于当前未完成周期的K线逐根更新
+        i = 0
+        while self.window_bar and i < len(ts) and ts[i] - ts[i] % self.length == self.window_bar.ts:
+            self.update_bar(BarData(int(ts[i]), *values[:, i].tolist()))
+            i += 1
+        if self.window_bar and i < len(ts):
+            self.finish_window_bar()
+
+        starts, bars, finished = aggregate_bars(ts[i:], values[:, i:], self.length)
+        for start, bar, done in zip(starts.tolist(), bars.T.tolist(), finished.tolist()):
+            self.window_bar = BarData(start, *bar)
+            if done:
+                self.finish_window_bar()
+
+        self.last_ts = int(ts[-1])
+
+    def finish_window_bar(self):
+        self.on_window_bar(self.window_bar)
+        self.window_bar = None
+
+
+class BarGeneratorHub:
+    """
+    用同一个 1 分钟K线流同时合成多个周期的K线.
+
+    每根K线只计算一次分钟序号, 各周期的边界判断都是整数运算, 相同周期的订阅共用一份聚合状态,
+    周期的对齐方式和结束规则与 BarGenerator 相同.
+    同一根K线上结束的周期K线在所有周期更新之后按订阅顺序回调,
+    顺序与按订阅顺序依次调用多个 BarGenerator.update_bar 相同.
+    """
 
-        # Cache last bar object
-        self.last_bar = bar
+    def __init__(self):
+        # 周期分钟数 -> [周期开始分钟, open, high, low, close, volume], 没有未完成的周期时为 None
+        self.states = {}
+        # (周期分钟数, 回调), 按订阅顺序
+        self.subscriptions = []
+
+    def subscribe(self, window: int, on_window_bar: Callable, interval: Interval = Interval.MINUTE):
+        """
+        订阅周期K线.
+        :param window: 周期数
+        :param on_window_bar: 周期K线结束时的回调
+        :param interval: 周期单位
+        """
+        minutes = window_length(window, interval) // MINUTE_NS
+        self.states.setdefault(minutes, None)
+        self.subscriptions.append((minutes, on_window_bar))
+
+    def update_bar(self, bar: BarData):
+        """
+        Update 1 minute bar into all subscribed windows
+        """
+        minute = bar.ts // MINUTE_NS
+        finished = {}
+
+        states = self.states
+        for minutes, state in states.items():
+            start = minute - minute % minutes
+            bars = []
+
+            # 有缺失的K线时, 上一个周期在下一个周期的K线到来时结束
+            if state is not None and state[0] != start:
+                bars.append(state)
+                state = None
+
+            if state is None:
+                state = [start, bar.open_price, bar.high_price, bar.low_price, bar.close_price, bar.volume]
+            else:
+                if bar.high_price > state[2]:
+                    state[2] = bar.high_price
+                if bar.low_price < state[3]:
+                    state[3] = bar.low_price
+                state[4] = bar.close_price
+                state[5] += bar.volume
+
+            if minute + 1 == start + minutes:
+                bars.append(state)
+                state = None
+
+            states[minutes] = state
+            if bars:
+                finished[minutes] = [BarData(values[0] * MINUTE_NS, *values[1:]) for values in bars]
+
+        if finished:
+            for minutes, on_window_bar in self.subscriptions:
+                for window_bar in finished.get(minutes, ()):
+                    on_window_bar(window_bar)
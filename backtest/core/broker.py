@@ -1,13 +1,21 @@
 """
     Broker 经纪人，负责处理处理撮合交易订单等功能.
 """
-import collections
+import collections.abc
+import contextlib
 import itertools
+import time
 
+import numpy as np
 import pandas as pd
 
 from .order import *
 from .strategy import BaseStrategy, BarData
+from .genetic import GeneticOptimizer
+from .journal import EventJournal, EventType
+from .optimizer import BacktestPool
+from .order_book import OrderBook
+from .vectorized import vectorized_backtest
 
 
 class Broker(object):
@@ -53,10 +61,10 @@ class Broker(object):
         self.trade_id = 0
 
         # 当前提交的订单.
-        self.active_orders = []
+        self.active_orders = OrderBook()
 
         # 当前提交的止盈/止损订单
-        self.stop_orders = []
+        self.stop_orders = OrderBook(stop=True)
 
         # 回测的数据 dataframe数据
         self.backtest_data = None
@@ -64,14 +72,54 @@ class Broker(object):
         # 当前的持仓量
         self.pos = 0
 
-        # 当前时间
-        self.datetime = None
+        # 当前时间, int64 纳秒时间戳
+        self.ts = None
 
         # 是否是运行策略优化的方法。
         self.is_optimizing_strategy = False
 
+        # 每日的盯市结果, 回测结束后计算, 以日期为索引的 DataFrame
         self.daily_results = {}
 
+        # 每根K线收盘时的盯市余额和持仓, 回测开始时按K线数量预分配.
+        self.balance_array = np.zeros(0)
+        self.pos_array = np.zeros(0)
+        self.bar_index = 0
+
+        # 成交产生的现金流(含手续费和滑点), 余额 = 本金 + 现金流 + 持仓 * 价格
+        self.cash_flow = 0
+
+        # 参数优化时, 没有参与优化的参数使用的默认值.
+        self.default_params = {}
+
+        # 是否使用列式数据驱动回测, 避免 DataFrame.iterrows 逐行装箱, 默认关闭, 见 set_columnar_feed.
+        self.columnar_feed = False
+
+        # 上一次回测的速度, 每秒处理的K线数量.
+        self.bars_per_second = 0
+
+        # 订单事件日志, 为 None 时不记录.
+        self.journal = None
+
+        # 是否对全部回测数据预先计算指标, 见 PrecomputedArrayManager.
+        self.precompute_indicators = False
+
+        # 从第几根K线开始交易, 之前的K线照常调用 next_bar 预热策略, 但不接受订单, 也不计入统计结果.
+        self.trading_start = 0
+
+        # 本地K线存储, 见 common.kline_store.KlineStore.
+        self.kline_store = None
+
+        # 从K线存储查询回测数据的条件 (symbol, start, end, interval), 直接设置 DataFrame 时为 None.
+        self.backtest_query = None
+
+    @property
+    def datetime(self):
+        """
+        当前时间, 只在下单、成交时转换为 pd.Timestamp.
+        """
+        return None if self.ts is None else pd.Timestamp(self.ts)
+
     def set_symbol(self, symbol):
         """
         设置交易对
@@ -104,20 +152,76 @@ class Broker(object):
         """
         self.commission = commission
 
-    def set_backtest_data(self, data: pd.DataFrame):
+    def set_kline_store(self, kline_store):
+        """
+        设置本地K线存储, 之后 set_backtest_data 可以按交易对和时间范围查询回测数据.
+        :param kline_store: common.kline_store.KlineStore
+        :return:
+        """
+        self.kline_store = kline_store
+
+    def set_backtest_data(self, data, start=None, end=None, interval='1m'):
+        """
+        设置回测数据.
+        :param data: 回测数据 DataFrame, 或者交易对名称, 为交易对名称时从 set_kline_store 设置的K线存储中查询,
+            查询范围在一个月份分区内时数据直接引用内存映射, 多进程优化时子进程各自映射同一份文件, 不拷贝数据
+        :param start: 开始时间, 只在从K线存储查询时使用
+        :param end: 结束时间, 只在从K线存储查询时使用, 不包含 end
+        :param interval: K线周期, 只在从K线存储查询时使用
+        :return:
+        """
+        if isinstance(data, str):
+            if self.kline_store is None:
+                raise ValueError("按交易对查询回测数据前需要先调用 set_kline_store")
+            self.backtest_query = (data, start, end, interval)
+            data = self.kline_store.query(data, start, end, interval)
+        else:
+            self.backtest_query = None
         self.backtest_data = data
 
     def set_cash(self, cash):
         self.cash = cash
 
+    def set_journal(self, journal: EventJournal):
+        """
+        设置订单事件日志, 每次回测开始时清空.
+        :param journal: 事件日志, None 表示不记录
+        :return:
+        """
+        self.journal = journal
+
+    def set_columnar_feed(self, columnar_feed: bool):
+        """
+        设置是否使用列式数据驱动回测.
+        列式数据复用同一个 BarData 对象, 每根K线原地更新, 策略中保存的 bar 引用会变成之后的K线,
+        只有不保存 bar 对象(只保存其中数值)的策略才能开启.
+        :param columnar_feed: True 使用 NumPy 列数据, False 使用 DataFrame.iterrows
+        :return:
+        """
+        self.columnar_feed = columnar_feed
+
+    def set_precompute_indicators(self, precompute_indicators: bool):
+        """
+        设置策略是否对全部回测数据预先计算指标, 策略需要通过 new_array_manager 创建 ArrayManager.
+        :param precompute_indicators: True 使用 PrecomputedArrayManager, False 使用滑动窗口的 ArrayManager
+        :return:
+        """
+        self.precompute_indicators = precompute_indicators
+
     def cancel_all(self):
         self.cancel_active_orders()
         self.cancel_stop_orders()
 
     def cancel_active_orders(self):
+        if self.journal is not None:
+            for order in self.active_orders:
+                self.journal.record(EventType.ORDER_CANCELLED, order, self.pos)
         self.active_orders.clear()
 
     def cancel_stop_orders(self):
+        if self.journal is not None:
+            for order in self.stop_orders:
+                self.journal.record(EventType.ORDER_CANCELLED, order, self.pos)
         self.stop_orders.clear()
 
     def generate_order_id(self):
@@ -158,64 +262,159 @@ class Broker(object):
         :param volume:
         :return:
         """
-        print(f"{self.bar.datetime}，做多下单: {volume}@{price}, 持仓：{self.pos}")
-
         """
         在这里生成订单， 等待价格到达后成交.
         """
-        self.active_orders.append(self.create_order(price, volume, Direction.LONG))
+        self.send_order(self.active_orders, self.create_order(price, volume, Direction.LONG))
 
     def sell(self, price, volume):
-        print(f"{self.bar.datetime}，做多平仓下单: {volume}@{price}, 持仓：{self.pos}")  #
         """
         在这里生成订单， 等待价格到达后成交.
         """
-        self.active_orders.append(self.create_order(price, volume, Direction.SELL))
+        self.send_order(self.active_orders, self.create_order(price, volume, Direction.SELL))
 
     def short(self, price, volume):
-        print(f"{self.bar.datetime}，做空下单: {volume}@{price}, 持仓：{self.pos}")
         """
         在这里生成订单， 等待价格到达后成交.
         """
-        self.active_orders.append(self.create_order(price, volume, Direction.SHORT))
+        self.send_order(self.active_orders, self.create_order(price, volume, Direction.SHORT))
 
     def cover(self, price, volume):
-        print(f"{self.bar.datetime}，做空平仓下单: {volume}@{price}, 持仓：{self.pos}")
         """
         在这里生成订单， 等待价格到达后成交.
         """
-        self.active_orders.append(self.create_order(price, volume, Direction.COVER))
+        self.send_order(self.active_orders, self.create_order(price, volume, Direction.COVER))
 
     def create_stop_order(self, price, volume, direction: Direction):
-        print(f"{self.bar.datetime}，止盈止损下单: {volume}@{price}, 持仓：{self.pos}")
         """
         在这里生成订单， 等待价格到达后成交.
         """
-        self.stop_orders.append(self.create_order(price, volume, direction, OrderType.STOP))
+        self.send_order(self.stop_orders, self.create_order(price, volume, direction, OrderType.STOP))
+
+    def send_order(self, order_book, order: OrderData):
+        """
+        把订单放入挂单簿, 等待撮合. trading_start 之前的预热K线上的订单直接丢弃.
+        """
+        if self.bar_index < self.trading_start:
+            return
+        if self.journal is not None:
+            self.journal.record(EventType.ORDER_CREATED, order, self.pos)
+        order_book.append(order)
 
     def run(self):
 
         self.trades = []  # 开始策略前，把trades设置为空列表，表示没有任何交易记录.
-        self.active_orders = []  #
+        self.active_orders = OrderBook()  #
+        self.stop_orders = OrderBook(stop=True)
+        self.pos = 0
+        self.order_id = 0
+        self.trade_id = 0
+        if self.journal is not None:
+            self.journal.clear()
+
+        bars = len(self.backtest_data)
+        self.balance_array = np.zeros(bars)
+        self.pos_array = np.zeros(bars)
+        self.bar_index = 0
+        self.cash_flow = 0
+
         self.strategy_instance = self.strategy_class(self.backtest_data)
         self.strategy_instance.broker = self
+        # 只设置在本次回测的策略实例上, 不影响策略类和其他 Broker
+        self.strategy_instance.precompute_indicators = self.precompute_indicators
         self.strategy_instance.on_start()
 
-        for index, candle in self.backtest_data.iterrows():
+        # 预热K线一次性交给策略, 不撮合订单, 按初始资金盯市.
+        warmup = min(self.strategy_instance.warmup_bars, bars)
+        if warmup:
+            self.strategy_instance.on_history(self.backtest_data.iloc[:warmup])
+            self.balance_array[:warmup] = self.cash
+            self.bar_index = warmup
+
+        start = time.perf_counter()
+        if self.columnar_feed:
+            self.run_columnar()
+        else:
+            self.run_iterrows()
+        elapsed = time.perf_counter() - start
+        # 预热K线不经过逐根循环, 不计入速度
+        self.bars_per_second = (bars - warmup) / elapsed if elapsed > 0 else 0
+
+        self.strategy_instance.on_stop()
+        self.calculate_daily_results()
+
+    def run_iterrows(self):
+        """
+        逐行遍历 DataFrame, 每根K线创建一个新的 BarData.
+        """
+        for index, candle in self.backtest_data.iloc[self.bar_index:].iterrows():
             bar = BarData(candle['open_time'], candle['open'],
                           candle['high'], candle['low'], candle['close'], candle['volume'])
-            self.bar = bar
-            self.datetime = bar.datetime
-            self.check_order(bar)  # 检查订单是否成交..
-            self.strategy_instance.next_bar(bar)  # 处理数据..
+            self.new_bar(bar)
 
-        self.strategy_instance.on_stop()
+    def run_columnar(self):
+        """
+        一次性取出 open_time/open/high/low/close/volume 列, 复用同一个 BarData 驱动回测.
+
+        注意: 传给策略的 bar 对象在每根K线都会被原地更新, 如需保留请自行拷贝数值.
+        """
+        data = self.backtest_data.iloc[self.bar_index:]
+        columns = [pd.to_datetime(data['open_time']).to_numpy().view(np.int64).tolist()]
+        columns += [data[name].tolist() for name in ('open', 'high', 'low', 'close', 'volume')]
+
+        bar = BarData(None, 0, 0, 0, 0, 0)
+        for ts, open_price, high_price, low_price, close_price, volume in zip(*columns):
+            bar.ts = ts
+            bar.open_price = open_price
+            bar.high_price = high_price
+            bar.low_price = low_price
+            bar.close_price = close_price
+            bar.volume = volume
+            self.new_bar(bar)
+
+    def new_bar(self, bar: BarData):
+        self.bar = bar
+        self.ts = bar.ts
+        self.check_order(bar)  # 检查订单是否成交..
+        self.strategy_instance.next_bar(bar)  # 处理数据..
+
+        # 按收盘价盯市
+        index = self.bar_index
+        self.balance_array[index] = self.cash + self.cash_flow + self.pos * bar.close_price
+        self.pos_array[index] = self.pos
+        self.bar_index = index + 1
+
+    def run_vectorized(self, pos):
+        """
+        向量化回测, 根据目标持仓序列计算资金曲线, 成交约定见 vectorized_backtest.
+        :param pos: 与 backtest_data 等长的目标持仓序列, 例如 signal_moving_average 计算出的 pos 列
+        :return: (资金曲线, 成交记录) 两个 DataFrame
+        """
+        data = self.backtest_data
+        equity, trades = vectorized_backtest(data['open'].to_numpy(), data['close'].to_numpy(), pos,
+                                             cash=self.cash, commission=self.commission,
+                                             slipper_rate=self.slipper_rate, leverage=self.leverage)
+
+        equity_df = pd.DataFrame({
+            'open_time': data['open_time'].to_numpy(),
+            'pos': np.nan_to_num(np.asarray(pos, dtype=float)),
+            'equity': equity,
+        })
+        trades_df = pd.DataFrame({
+            'datetime': data['open_time'].to_numpy()[trades['index']],
+            'symbol': self.symbol,
+            'price': trades['price'],
+            'volume': trades['volume'],
+            'pos': trades['pos'],
+        })
+        return equity_df, trades_df
 
     def output(self, msg):
         """
-        Output message of backtesting engine.
+        Output message of backtesting engine, suppressed while optimizing.
         """
-        print(f"{datetime.now()}\t{msg}")
+        if not self.is_optimizing_strategy:
+            print(f"{datetime.now()}\t{msg}")
 
     # 统计成交的信息.. 夏普率、 盈亏比、胜率、 最大回撤 年化率/最大回撤
     def calculate(self) -> pd.DataFrame:
@@ -225,48 +424,144 @@ class Broker(object):
         columns = ['datetime', 'symbol',  'open', 'high', 'low', 'close', 'order_id', 'trade_id', 'price', 'volume', 'direction',
                    'balance', 'profit', 'pos', 'turnover', 'slippage', 'commission', 'trading_pnl']
 
-        data = []
+        if not self.trades:
+            return pd.DataFrame(columns=columns)
+
+        trades = self.trades
+        price = np.array([trade.price for trade in trades])
+        volume = np.array([trade.volume for trade in trades])
+
+        # K线数据, 按成交时间在 open_time 列上二分查找所在的K线.
+        open_time = pd.to_datetime(self.backtest_data['open_time']).to_numpy()
+        trade_time = pd.to_datetime([trade.datetime for trade in trades]).to_numpy()
+        rows = np.searchsorted(open_time, trade_time)
+        rows[rows == len(open_time)] = 0
+        if not (open_time[rows] == trade_time).all():
+            raise KeyError("成交时间在回测数据中找不到对应的K线")
+        kline = self.backtest_data.iloc[rows]
+
+        # 成交额
+        turnover = np.abs(volume * self.leverage * price)
+        # 滑点费用
+        slippage = turnover * self.slipper_rate
+        # 手续费
+        commission = turnover * self.commission
 
         # 持仓数量
-        pos = 0
-        # 持仓成本
-        holding_cost = 0
-        # 利润
-        profit = 0
-
-        for trade in self.trades:
-            # K线数据
-            kline = self.backtest_data[self.backtest_data.open_time == trade.datetime].iloc[0]
-            # 成交额
-            turnover = abs(trade.volume * self.leverage * trade.price)
-            # 滑点费用
-            slippage = turnover * self.slipper_rate
-            # 手续费
-            commission = turnover * self.commission
-
-            # 平仓
-            if (pos + trade.volume) == 0:
-                # 交易利润 = （平仓价格 - 开仓价格）* 平仓数量
-                trading_pnl = (trade.price - holding_cost) * pos if holding_cost != 0 else 0
-                holding_cost = 0
-            else:
-                trading_pnl = 0
-                holding_cost = trade.price
-
-            # 利润
-            profit = profit + trading_pnl - commission - slippage
-            # 余额 = 本金 + 利润
-            balance = self.cash + profit
-            # 持仓数量
-            pos += trade.volume
+        pos = np.cumsum(volume)
+        pos_before = np.concatenate(([0], pos[:-1]))
+
+        # 平仓: 持仓回到0. 两次平仓之间的成交为一次完整的交易.
+        close = (pos_before + volume) == 0
+        round_trip = np.concatenate(([0], np.cumsum(close)[:-1]))
+
+        # 交易利润 = 这次交易中所有成交的现金流之和, 在平仓的成交上记录, 加仓、减仓也按实际成交价计算,
+        # 平仓时的余额与按K线盯市的余额一致.
+        cash_flow = np.bincount(round_trip, weights=-volume * price)
+        trading_pnl = np.where(close, cash_flow[round_trip], 0.0)
+
+        # 利润, 按 (利润 + 交易利润 - 手续费 - 滑点) 的顺序逐笔累加, 与逐笔计算的结果一致.
+        profit = np.add.accumulate(np.column_stack((trading_pnl, -commission, -slippage)).ravel())[2::3]
+        # 余额 = 本金 + 利润
+        balance = self.cash + profit
+
+        df = pd.DataFrame({
+            'datetime': [trade.datetime for trade in trades],
+            'symbol': [trade.symbol for trade in trades],
+            'open': kline['open'].to_numpy(),
+            'high': kline['high'].to_numpy(),
+            'low': kline['low'].to_numpy(),
+            'close': kline['close'].to_numpy(),
+            'order_id': [trade.order_id for trade in trades],
+            'trade_id': [trade.trade_id for trade in trades],
+            'price': price,
+            'volume': volume,
+            'direction': [trade.direction for trade in trades],
+            'balance': balance,
+            'profit': profit,
+            'pos': pos,
+            'turnover': turnover,
+            'slippage': slippage,
+            'commission': commission,
+            'trading_pnl': trading_pnl,
+        }, columns=columns)
 
-            data.append([trade.datetime, trade.symbol, kline.open, kline.high, kline.low, kline.close,
-                         trade.order_id, trade.trade_id, trade.price, trade.volume, trade.direction,
-                         balance, profit, pos, turnover, slippage, commission, trading_pnl])
+        return df
 
-        df = pd.DataFrame(data=data, columns=columns)
+    def calculate_daily_results(self):
+        """
+        根据每根K线的盯市余额计算每日结果.
+        """
+        start = min(self.trading_start, self.bar_index)
+        balance = self.balance_array[start:self.bar_index]
+        days = pd.to_datetime(self.backtest_data['open_time']).to_numpy()[start:self.bar_index].astype('datetime64[D]')
+
+        # 每天最后一根K线
+        last = np.flatnonzero(np.append(days[1:] != days[:-1], True)) if len(days) else np.zeros(0, dtype=int)
+        daily_balance = balance[last]
+        pre_balance = np.concatenate(([self.cash], daily_balance[:-1]))
+
+        self.daily_results = pd.DataFrame({
+            'balance': daily_balance,
+            'net_pnl': daily_balance - pre_balance,
+            'return': daily_balance / pre_balance - 1,
+            'pos': self.pos_array[start:self.bar_index][last],
+        }, index=pd.DatetimeIndex(days[last], name='date'))
+
+    def equity_curve(self) -> pd.DataFrame:
+        """
+        每根K线收盘时的盯市余额和持仓.
+        """
+        return pd.DataFrame({
+            'open_time': self.backtest_data['open_time'].to_numpy()[:self.bar_index],
+            'pos': self.pos_array[:self.bar_index],
+            'balance': self.balance_array[:self.bar_index],
+        })
 
-        return df
+    def statistics(self, df: pd.DataFrame = None) -> dict:
+        """
+        根据盯市余额和成交记录统计回测结果.
+        :param df: calculate() 的成交记录, 为空时重新计算
+        :return: 最终余额、成交次数、最大回撤（比例）、夏普率、总收益率、年化收益率、收益回撤比、胜率、盈亏比
+        """
+        if df is None:
+            df = self.calculate()
+
+        balance = self.balance_array[min(self.trading_start, self.bar_index):self.bar_index]
+        end_balance = balance[-1] if len(balance) else self.cash
+
+        # 最大回撤, 按每根K线的盯市余额计算
+        balance_curve = np.concatenate(([self.cash], balance))
+        highlevel = np.maximum.accumulate(balance_curve)
+        max_drawdown = np.max((highlevel - balance_curve) / highlevel)
+
+        # 夏普率, 数字货币按一年365天计算
+        daily_return = self.daily_results['return'].to_numpy()
+        return_std = np.std(daily_return) if len(daily_return) else 0
+        sharpe_ratio = np.mean(daily_return) / return_std * np.sqrt(365) if return_std else 0
+
+        total_return = end_balance / self.cash - 1
+        annual_return = total_return / len(daily_return) * 365 if len(daily_return) else 0
+        return_drawdown_ratio = total_return / max_drawdown if max_drawdown else 0
+
+        # 胜率和盈亏比, 按每次平仓的交易利润计算
+        pnl = df['trading_pnl'].to_numpy(dtype=float)[df['pos'].to_numpy() == 0]
+        win = pnl[pnl > 0]
+        loss = pnl[pnl < 0]
+        win_rate = len(win) / len(pnl) if len(pnl) else 0
+        profit_loss_ratio = win.mean() / -loss.mean() if len(win) and len(loss) else 0
+
+        return {
+            'balance': end_balance,
+            'trade_count': len(df),
+            'max_drawdown': max_drawdown,
+            'sharpe_ratio': sharpe_ratio,
+            'total_return': total_return,
+            'annual_return': annual_return,
+            'return_drawdown_ratio': return_drawdown_ratio,
+            'win_rate': win_rate,
+            'profit_loss_ratio': profit_loss_ratio,
+        }
 
     def check_order(self, bar):
         """
@@ -281,40 +576,35 @@ class Broker(object):
         self.cross_limit_order()
         self.cross_stop_order()
 
+    def trade_cost(self, price, volume):
+        """
+        成交的手续费和滑点, 与 calculate 中的计算方式一致.
+        """
+        turnover = abs(volume * self.leverage * price)
+        return turnover * self.commission + turnover * self.slipper_rate
+
     def cross_limit_order(self):
         long_cross_price = self.bar.low_price
         short_cross_price = self.bar.high_price
         long_best_price = self.bar.open_price
         short_best_price = self.bar.open_price
 
-        for order in self.active_orders:
-
-            # Check whether limit orders can be filled.
-            long_cross = (
-                    (order.direction == Direction.LONG or order.direction == Direction.COVER)
-                    and order.price >= long_cross_price > 0
-            )
+        # Only orders whose price crosses the bar are popped from the order book.
+        for order in self.active_orders.cross(long_cross_price, short_cross_price):
 
-            short_cross = (
-                    (order.direction == Direction.SHORT or order.direction == Direction.SELL)
-                    and order.price <= short_cross_price
-                    and short_cross_price > 0
-            )
-
-            if not long_cross and not short_cross:
-                continue
-
-            if long_cross:
+            if order.direction == Direction.LONG or order.direction == Direction.COVER:
                 trade_price = min(order.price, long_best_price)
                 pos_change = order.volume
             else:
                 trade_price = max(order.price, short_best_price)
                 pos_change = -order.volume
 
-            self.active_orders.remove(order)
             self.pos += pos_change
+            self.cash_flow -= pos_change * trade_price + self.trade_cost(trade_price, pos_change)
             trade = self.create_trade(trade_price, pos_change, order.direction, order.order_id)
             self.trades.append(trade)
+            if self.journal is not None:
+                self.journal.record(EventType.ORDER_FILLED, order, self.pos, trade)
 
     def cross_stop_order(self):
         """
@@ -323,68 +613,236 @@ class Broker(object):
         long_cross_price = self.bar.high_price
         short_cross_price = self.bar.low_price
 
-        for order in self.stop_orders:
-
-            # Check whether limit orders can be filled.
-            long_cross = (
-                    (order.direction == Direction.LONG or order.direction == Direction.COVER)
-                    and order.price <= long_cross_price > 0
-            )
+        # Only stop orders whose price is triggered by the bar are popped from the order book.
+        for order in self.stop_orders.cross(long_cross_price, short_cross_price):
 
-            short_cross = (
-                    (order.direction == Direction.SHORT or order.direction == Direction.SELL)
-                    and order.price >= short_cross_price > 0
-            )
-
-            if not long_cross and not short_cross:
-                continue
-
-            if long_cross:
+            if order.direction == Direction.LONG or order.direction == Direction.COVER:
                 trade_price = min(order.price, long_cross_price)
                 pos_change = order.volume
             else:
                 trade_price = max(order.price, short_cross_price)
                 pos_change = -order.volume
 
-            self.stop_orders.remove(order)
             self.pos += pos_change
+            self.cash_flow -= pos_change * trade_price + self.trade_cost(trade_price, pos_change)
             trade = self.create_trade(trade_price, pos_change, order.direction, order.order_id)
             self.trades.append(trade)
+            if self.journal is not None:
+                self.journal.record(EventType.ORDER_FILLED, order, self.pos, trade)
 
-    def optimize_strategy(self, **kwargs):
+    @contextlib.contextmanager
+    def optimizing(self):
         """
-        优化策略， 参数遍历进行..
-        :param kwargs:
-        :return:
+        参数优化期间关闭输出, 没有参与优化的参数使用策略的默认值, 结束后恢复策略的参数.
         """
         self.is_optimizing_strategy = True
+        default_params = self.strategy_class.params
+        self.default_params = dict(default_params)
+        try:
+            yield
+        finally:
+            self.strategy_class.params = default_params
+            self.is_optimizing_strategy = False
+
+    def optimize_strategy(self, processes=1, chunksize=1, sort_by='balance', halving_rounds=0, eta=3, warmup_bars=None,
+                          **kwargs):
+        """
+        优化策略， 参数遍历进行..
+        :param processes: 进程数, 1 表示在当前进程中串行运行, None 表示使用全部 CPU 核心
+        :param chunksize: 多进程时每次分发给子进程的参数组数量
+        :param sort_by: 排名使用的指标, 从大到小排序
+        :param halving_rounds: 逐次减半的轮数, 0 表示所有参数组都在全部数据上回测.
+            大于 0 时先用前 1/eta^halving_rounds 的数据回测所有参数组, 每轮只保留排名前 1/eta 的参数组,
+            并把数据长度放大 eta 倍, 最后一轮在全部数据上回测.
+            每轮的数据都在预热K线之后按比例截取, 即 warmup_bars + (K线数量 - warmup_bars) / eta^轮数,
+            避免前几轮的数据全部用于预热、所有参数组都没有成交.
+        :param eta: 逐次减半时每轮保留的比例的倒数
+        :param warmup_bars: 逐次减半时每轮额外保留的预热K线数量, None 表示使用策略的 warmup_bars
+        :param kwargs: 要优化的参数及其取值列表
+        :return: 每组参数一行的结果 DataFrame, 包含参数、bars（最后一次回测使用的K线数量）、
+            balance、trade_count、max_drawdown、sharpe_ratio、runtime, 按 bars 和 sort_by 从大到小排名
+        """
+        optkwargs = _param_grid(kwargs)
+
+        total_bars = len(self.backtest_data)
+        if warmup_bars is None:
+            warmup_bars = self.strategy_class.warmup_bars
+        warmup_bars = min(warmup_bars, total_bars)
+        results = {}
+        candidates = list(range(len(optkwargs)))
+
+        with self.optimizing(), BacktestPool(self, processes, chunksize) as pool:
+            for round_index in range(halving_rounds, -1, -1):
+                bars = warmup_bars + (total_bars - warmup_bars) // eta ** round_index
+                rows = pool.map([(optkwargs[i], None, bars) for i in candidates])
+                results.update(zip(candidates, rows))
+
+                # 淘汰排名靠后的参数组
+                keep = max(1, -(-len(candidates) // eta))
+                ranked = sorted(zip(candidates, rows), key=lambda item: item[1][sort_by], reverse=True)
+                candidates = [i for i, row in ranked[:keep]]
+
+        df = pd.DataFrame([results[i] for i in sorted(results)])
+        df.sort_values(['bars', sort_by], ascending=False, inplace=True, kind='mergesort')
+        df.reset_index(drop=True, inplace=True)
+        return df
 
-        optkeys = list(kwargs)
-        vals = iterize(kwargs.values())
-        optvals = itertools.product(*vals)  #
-        optkwargs = map(zip, itertools.repeat(optkeys), optvals)
-        optkwargs = map(dict, optkwargs)  # dict value...
+    def optimize_genetic(self, processes=1, chunksize=1, sort_by='balance', budget=200, population_size=20,
+                         surrogate=False, seed=None, **kwargs):
+        """
+        遗传算法优化策略, 适合参数组合太多、无法穷举的情况.
+        :param processes: 进程数, 1 表示在当前进程中串行运行, None 表示使用全部 CPU 核心
+        :param chunksize: 多进程时每次分发给子进程的参数组数量
+        :param sort_by: 优化的目标指标, 越大越好
+        :param budget: 最多回测的参数组数量, 回测过的参数组不会重复回测
+        :param population_size: 种群大小
+        :param surrogate: 是否使用高斯过程代理模型挑选子代
+        :param seed: 随机数种子
+        :param kwargs: 要优化的参数及其取值列表
+        :return: 回测过的参数组的结果 DataFrame, 列与 optimize_strategy 相同, 另有 generation 列, 按 sort_by 从大到小排名
+        """
+        space = dict(zip(kwargs, iterize(kwargs.values())))
+        with self.optimizing(), BacktestPool(self, processes, chunksize) as pool:
+            optimizer = GeneticOptimizer(pool, space, sort_by=sort_by, budget=budget,
+                                         population_size=population_size, surrogate=surrogate, seed=seed)
+            return optimizer.run()
 
-        # for params in optkwargs:
-        #     print(params)
+    def walk_forward(self, train_bars, test_bars, warmup_bars=0, processes=1, chunksize=1, sort_by='balance', **kwargs):
+        """
+        滚动样本内/样本外优化.
+
+        把回测数据切分成连续的窗口, 每个窗口先在样本内 train_bars 根K线上穷举参数, 再用排名第一的参数
+        回测紧接着的 test_bars 根K线（样本外）, 然后窗口向后移动 test_bars 根K线.
+        指标的预热通过在每个窗口前面多取 warmup_bars 根K线实现, 不需要从头开始计算,
+        warmup_bars 应不小于策略开始交易前需要的K线数量, 例如 ArrayManager 的 size.
+        预热K线照常调用策略的 next_bar, 但不接受订单, 也不计入成交记录和统计结果 (见 trading_start).
+        所有窗口的样本内回测一起分发给进程池, 样本外回测也一起分发.
+
+        :param train_bars: 样本内K线数量
+        :param test_bars: 样本外K线数量, 也是窗口移动的步长
+        :param warmup_bars: 每个窗口前面用于预热指标的K线数量
+        :param processes: 进程数, 1 表示在当前进程中串行运行, None 表示使用全部 CPU 核心
+        :param chunksize: 多进程时每次分发给子进程的任务数量
+        :param sort_by: 样本内排名使用的指标, 从大到小排序
+        :param kwargs: 要优化的参数及其取值列表
+        :return: (每个窗口的结果 DataFrame, 拼接后的样本外成交记录 DataFrame, 拼接后的样本外盯市余额 DataFrame).
+            拼接后的 balance 为窗口内的余额加上之前所有窗口样本外的利润, 窗口结束时未平仓的持仓按收盘价盯市计算利润.
+        """
+        optkwargs = _param_grid(kwargs)
+
+        # 切分窗口, (预热开始, 样本内开始, 样本外开始, 样本外结束)
+        total_bars = len(self.backtest_data)
+        folds = []
+        start = 0
+        while start + train_bars < total_bars:
+            folds.append((max(0, start - warmup_bars), start, start + train_bars,
+                          min(start + train_bars + test_bars, total_bars)))
+            start += test_bars
+
+        with self.optimizing(), BacktestPool(self, processes, chunksize) as pool:
+            # 所有窗口的样本内回测
+            tasks = [(params, warmup, out_start, False, in_start - warmup)
+                     for warmup, in_start, out_start, _ in folds for params in optkwargs]
+            rows = pool.map(tasks)
+
+            best_params = []
+            for i in range(len(folds)):
+                fold_rows = rows[i * len(optkwargs):(i + 1) * len(optkwargs)]
+                best = max(range(len(fold_rows)), key=lambda j: fold_rows[j][sort_by])
+                best_params.append((optkwargs[best], fold_rows[best]))
+
+            # 所有窗口的样本外回测, 预热数据取样本外之前的 warmup_bars 根K线, 预热期间不交易
+            tasks = [(params, max(0, out_start - warmup_bars), out_end, True, min(warmup_bars, out_start))
+                     for (params, _), (_, _, out_start, out_end) in zip(best_params, folds)]
+            out_rows = pool.map(tasks)
+
+        open_time = self.backtest_data['open_time']
+        results = []
+        ledgers = []
+        equities = []
+        profit = 0
+        for i, ((_, in_start, out_start, out_end), (params, in_row), out_row) in enumerate(zip(folds, best_params, out_rows)):
+            # 拼接样本外的余额, 去掉预热部分的K线
+            equity = out_row.pop('equity')
+            equity = equity.iloc[len(equity) - (out_end - out_start):].reset_index(drop=True)
+            equity['fold'] = i
+            equity['balance'] = equity['balance'] + profit
+            equities.append(equity)
+
+            ledger = out_row.pop('ledger')
+            ledger['fold'] = i
+            ledger['balance'] = ledger['balance'] + profit
+            ledgers.append(ledger)
+
+            profit += out_row['balance'] - self.cash
+
+            results.append(dict(params, fold=i,
+                                in_sample_start=open_time.iloc[in_start], out_sample_start=open_time.iloc[out_start],
+                                out_sample_end=open_time.iloc[out_end - 1],
+                                in_sample_score=in_row[sort_by], out_sample_profit=out_row['balance'] - self.cash,
+                                out_sample_trade_count=out_row['trade_count'],
+                                out_sample_max_drawdown=out_row['max_drawdown'],
+                                out_sample_sharpe_ratio=out_row['sharpe_ratio']))
+
+        ledger = pd.concat(ledgers, ignore_index=True) if ledgers else None
+        equity = pd.concat(equities, ignore_index=True) if equities else None
+        return pd.DataFrame(results), ledger, equity
+
+    def run_params(self, params, start=None, end=None, ledger=False, warmup=0):
+        """
+        用一组参数跑一次回测.
+        :param params: 要优化的参数, 与默认参数合并后设置到策略类
+        :param start: 只使用从第 start 根开始的K线回测, None 表示从头开始
+        :param end: 只使用第 end 根之前的K线回测, None 表示到数据结束
+        :param ledger: 是否在结果中包含 calculate() 的成交记录和 equity_curve() 的盯市余额
+        :param warmup: 截取的K线中前 warmup 根只用于预热策略, 不交易, 不计入统计结果
+        :return: 参数和回测结果的字典
+        """
+        self.output(f"回测参数：{params}")
 
         # 参数列表, 要优化的参数, 放在这里.
         cash = self.cash
         leverage = self.leverage
         commission = self.commission
-        for params in optkwargs:
-            print(params)
-            self.strategy_class.params = params
-            self.set_cash(cash)
-            self.set_leverage(leverage)
-            self.set_commission(commission)
+
+        self.strategy_class.params = dict(self.default_params, **params)
+        self.set_cash(cash)
+        self.set_leverage(leverage)
+        self.set_commission(commission)
+
+        data = self.backtest_data
+        self.backtest_data = data.iloc[start:end]
+        self.trading_start = warmup
+
+        run_start = time.perf_counter()
+        try:
             self.run()
+            df = self.calculate()
+            result = dict(params, bars=len(self.backtest_data), **self.statistics(df))
+            if ledger:
+                result['ledger'] = df
+                result['equity'] = self.equity_curve()
+        finally:
+            self.backtest_data = data
+            self.trading_start = 0
+        result['runtime'] = time.perf_counter() - run_start
+        return result
 
     def output_record(self, path):
         if self.strategy_instance:
             self.strategy_instance.output_record(path)
 
 
+def _param_grid(kwargs) -> list:
+    """
+    参数取值列表的笛卡尔积.
+    :param kwargs: 参数名 -> 取值列表, 单个取值视为只有一个取值的列表
+    :return: [{参数名: 取值}, ...]
+    """
+    optkeys = list(kwargs)
+    return [dict(zip(optkeys, values)) for values in itertools.product(*iterize(kwargs.values()))]
+
+
 def iterize(iterable):
     '''Handy function which turns things into things that can be iterated upon
     including iterables
@@ -393,7 +851,7 @@ def iterize(iterable):
     for elem in iterable:
         if isinstance(elem, str):
             elem = (elem,)
-        elif not isinstance(elem, collections.Iterable):
+        elif not isinstance(elem, collections.abc.Iterable):
             elem = (elem,)
 
         niterable.append(elem)
@@ -1,19 +1,67 @@
 
+import numpy as np
+import pandas as pd
+
+
+def to_timestamp(value):
+    """
+    把时间转换为 int64 纳秒时间戳, 与 datetime64[ns] 的整数表示一致.
+    :param value: int 时间戳 / datetime / pd.Timestamp / np.datetime64 / 字符串, None 表示没有时间
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, np.datetime64):
+        return int(value.astype('datetime64[ns]').astype(np.int64))
+    return pd.Timestamp(value).value
+
+
 class BarData(object):
     """
     K 线数据模型.
+    时间以 int64 纳秒时间戳保存在 ts 中, datetime 属性按需转换为 pd.Timestamp.
     """
     def __init__(self, datetime, open_price, high_price, low_price, close_price, volume):
-        self.datetime = datetime
+        self.ts = to_timestamp(datetime)
         self.open_price = open_price
         self.high_price = high_price
         self.low_price = low_price
         self.close_price = close_price
         self.volume = volume
 
+    @property
+    def datetime(self):
+        return None if self.ts is None else pd.Timestamp(self.ts)
+
+    @datetime.setter
+    def datetime(self, value):
+        self.ts = to_timestamp(value)
+
     def __str__(self):
         return f"{self.datetime} {self.open_price} {self.high_price} {self.low_price} {self.close_price} {self.volume}"
 
 
+class TickData(object):
+    """
+    逐笔成交数据模型, 时间的保存方式与 BarData 相同.
+    """
+    def __init__(self, datetime, price, volume):
+        self.ts = to_timestamp(datetime)
+        self.price = price
+        self.volume = volume
+
+    @property
+    def datetime(self):
+        return None if self.ts is None else pd.Timestamp(self.ts)
+
+    @datetime.setter
+    def datetime(self, value):
+        self.ts = to_timestamp(value)
+
+    def __str__(self):
+        return f"{self.datetime} {self.price} {self.volume}"
+
+
 class TradeData(object):
     pass
\ No newline at end of file
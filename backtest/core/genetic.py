@@ -0,0 +1,212 @@
+"""
+    遗传算法参数优化, 可选用高斯过程代理模型挑选候选参数.
+"""
+
+import random
+from math import erf
+
+import numpy as np
+import pandas as pd
+
+
+class GeneticOptimizer(object):
+    """
+    在离散参数空间上做遗传算法搜索.
+
+    每个参数点用各参数取值的下标表示, 回测过的参数点会被缓存, 不会重复回测,
+    回测总次数不超过 budget. 每一代新产生的参数点一起交给回测任务池并行运行.
+    """
+
+    def __init__(self, pool, space: dict, sort_by='balance', budget=200, population_size=20,
+                 mutation_rate=0.2, crossover_rate=0.8, tournament_size=3, surrogate=False,
+                 surrogate_candidates=10, seed=None):
+        """
+        :param pool: BacktestPool 回测任务池
+        :param space: 参数名 -> 取值列表
+        :param sort_by: 优化的目标指标, 越大越好
+        :param budget: 最多回测的参数点数量
+        :param population_size: 种群大小, 也是每一代新回测的参数点数量
+        :param mutation_rate: 每个参数发生变异的概率
+        :param crossover_rate: 两个父代发生交叉的概率
+        :param tournament_size: 锦标赛选择时每次参与比较的个体数量
+        :param surrogate: 是否使用高斯过程代理模型, 从更多的候选子代中挑选期望提升最大的参数点回测
+        :param surrogate_candidates: 使用代理模型时, 候选子代数量是种群大小的倍数
+        :param seed: 随机数种子
+        """
+        self.pool = pool
+        self.keys = list(space)
+        self.values = [list(space[key]) for key in self.keys]
+        self.sort_by = sort_by
+        self.budget = budget
+        self.population_size = population_size
+        self.mutation_rate = mutation_rate
+        self.crossover_rate = crossover_rate
+        self.tournament_size = tournament_size
+        self.surrogate = surrogate
+        self.surrogate_candidates = surrogate_candidates
+        self.random = random.Random(seed)
+
+        # 参数空间大小
+        self.space_size = int(np.prod([len(values) for values in self.values]))
+
+        # 已回测的参数点 -> 回测结果
+        self.results = {}
+        # 已回测的参数点 -> 目标值
+        self.fitness = {}
+
+    def to_params(self, point):
+        return {key: values[i] for key, values, i in zip(self.keys, self.values, point)}
+
+    def random_point(self):
+        return tuple(self.random.randrange(len(values)) for values in self.values)
+
+    def evaluate(self, points, generation):
+        """
+        回测还没有回测过的参数点.
+        """
+        points = [point for point in dict.fromkeys(points) if point not in self.results]
+        points = points[:self.budget - len(self.results)]
+        if not points:
+            return
+
+        rows = self.pool.map([(self.to_params(point),) for point in points])
+        for point, row in zip(points, rows):
+            row['generation'] = generation
+            self.results[point] = row
+            value = row[self.sort_by]
+            self.fitness[point] = value if np.isfinite(value) else -np.inf
+
+    def select(self, population):
+        """
+        锦标赛选择.
+        """
+        contestants = self.random.sample(population, min(self.tournament_size, len(population)))
+        return max(contestants, key=self.fitness.get)
+
+    def crossover(self, parent1, parent2):
+        """
+        均匀交叉.
+        """
+        if self.random.random() >= self.crossover_rate:
+            return parent1
+        return tuple(a if self.random.random() < 0.5 else b for a, b in zip(parent1, parent2))
+
+    def mutate(self, point):
+        """
+        变异, 大部分时候取相邻的值, 偶尔随机跳到任意值.
+        """
+        genes = list(point)
+        for i, values in enumerate(self.values):
+            if len(values) < 2 or self.random.random() >= self.mutation_rate:
+                continue
+            if self.random.random() < 0.7:
+                genes[i] = min(max(genes[i] + self.random.choice((-1, 1)), 0), len(values) - 1)
+            else:
+                genes[i] = self.random.randrange(len(values))
+        return tuple(genes)
+
+    def breed(self, population, count):
+        """
+        产生 count 个没有回测过的子代.
+        """
+        children = []
+        seen = set()
+        for _ in range(count * 50):
+            if len(children) >= count:
+                break
+            child = self.mutate(self.crossover(self.select(population), self.select(population)))
+            if child in self.results or child in seen:
+                continue
+            seen.add(child)
+            children.append(child)
+        return children
+
+    def suggest(self, candidates, count):
+        """
+        用高斯过程代理模型, 从候选参数点中挑选期望提升最大的 count 个.
+        """
+        points = [point for point in self.results if np.isfinite(self.fitness[point])]
+        if len(points) < 2 or len(candidates) <= count:
+            return candidates[:count]
+
+        scale = np.array([max(len(values) - 1, 1) for values in self.values], dtype=float)
+        x = np.array(points, dtype=float) / scale
+        y = np.array([self.fitness[point] for point in points], dtype=float)
+        y_mean, y_std = y.mean(), y.std() or 1.0
+        y = (y - y_mean) / y_std
+
+        mean, std = gaussian_process(x, y, np.array(candidates, dtype=float) / scale)
+        ei = expected_improvement(mean, std, y.max())
+        order = np.argsort(-ei, kind='stable')[:count]
+        return [candidates[i] for i in order]
+
+    def run(self) -> pd.DataFrame:
+        """
+        运行遗传算法.
+        :return: 所有回测过的参数点的结果, 按目标值从大到小排名
+        """
+        budget = min(self.budget, self.space_size)
+
+        # 初始种群
+        population = set()
+        while len(population) < min(self.population_size, budget):
+            population.add(self.random_point())
+        self.evaluate(sorted(population), 0)
+        population = list(self.results)
+
+        generation = 0
+        while len(self.results) < budget:
+            generation += 1
+            count = min(self.population_size, budget - len(self.results))
+
+            if self.surrogate:
+                children = self.suggest(self.breed(population, count * self.surrogate_candidates), count)
+            else:
+                children = self.breed(population, count)
+
+            # 种群已经收敛, 没有新的子代时补充随机个体.
+            if not children:
+                children = [point for point in (self.random_point() for _ in range(count * 50))
+                            if point not in self.results][:count]
+                if not children:
+                    break
+
+            self.evaluate(children, generation)
+
+            # 精英保留, 从父代和子代中取最好的个体作为新的种群
+            population = sorted(set(population) | set(point for point in children if point in self.results),
+                                key=self.fitness.get, reverse=True)[:self.population_size]
+
+        df = pd.DataFrame(list(self.results.values()))
+        df.sort_values(self.sort_by, ascending=False, inplace=True, kind='mergesort')
+        df.reset_index(drop=True, inplace=True)
+        return df
+
+
+def gaussian_process(x, y, x_new, length_scale=0.2, noise=1e-3):
+    """
+    RBF 核的高斯过程回归.
+    :return: x_new 处的预测均值和标准差
+    """
+    def kernel(a, b):
+        distance = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * distance / length_scale ** 2)
+
+    k = kernel(x, x) + noise * np.eye(len(x))
+    k_new = kernel(x_new, x)
+    chol = np.linalg.cholesky(k)
+    alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, y))
+    mean = k_new @ alpha
+    v = np.linalg.solve(chol, k_new.T)
+    var = np.maximum(1 - (v ** 2).sum(axis=0), 1e-12)
+    return mean, np.sqrt(var)
+
+
+def expected_improvement(mean, std, best, xi=0.01):
+    """
+    期望提升.
+    """
+    z = (mean - best - xi) / std
+    cdf = 0.5 * (1 + np.vectorize(erf)(z / np.sqrt(2)))
+    pdf = np.exp(-0.5 * z ** 2) / np.sqrt(2 * np.pi)
+    return (mean - best - xi) * cdf + std * pdf
@@ -0,0 +1,156 @@
+"""
+    回测事件日志, 把订单的创建、成交、撤销记录到预分配的环形缓冲区或二进制文件中.
+"""
+
+from enum import IntEnum
+
+import numpy as np
+import pandas as pd
+
+from .order import Direction, OrderType, OrderData, TradeData
+
+
+class EventType(IntEnum):
+    """
+    事件类型.
+    """
+    ORDER_CREATED = 1
+    ORDER_FILLED = 2
+    ORDER_CANCELLED = 3
+
+
+class EventLevel(IntEnum):
+    """
+    日志级别, 只记录级别不低于日志设置的事件.
+    """
+    DEBUG = 10  # 订单创建、撤销
+    INFO = 20  # 订单成交
+
+
+EVENT_LEVELS = {
+    EventType.ORDER_CREATED: EventLevel.DEBUG,
+    EventType.ORDER_CANCELLED: EventLevel.DEBUG,
+    EventType.ORDER_FILLED: EventLevel.INFO,
+}
+
+EVENT_DTYPE = np.dtype([
+    ('event', np.int8),
+    ('datetime', np.int64),
+    ('order_id', np.int64),
+    ('trade_id', np.int64),
+    ('direction', np.int8),
+    ('type', np.int8),
+    ('price', np.float64),
+    ('volume', np.float64),
+    ('pos', np.float64),
+])
+
+DIRECTIONS = list(Direction)
+ORDER_TYPES = list(OrderType)
+
+
+class EventJournal(object):
+    """
+    结构化事件日志.
+
+    事件写入预分配的 numpy 结构化数组, 写满后:
+    1. 没有设置 path 时覆盖最旧的事件(环形缓冲区);
+    2. 设置了 path 时把整个缓冲区追加写入二进制文件, 然后从头开始写.
+    Broker 没有设置日志时不会产生任何开销.
+    """
+
+    def __init__(self, capacity=100_000, level: EventLevel = EventLevel.DEBUG, path=None, echo=False):
+        """
+        :param capacity: 缓冲区能保存的事件数量
+        :param level: 日志级别
+        :param path: 二进制文件路径, 为 None 时只使用环形缓冲区
+        :param echo: 是否同时打印到控制台
+        """
+        self.level = level
+        self.path = path
+        self.echo = echo
+        self.buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        # 写入的事件总数
+        self.count = 0
+        # 已经写入文件的事件数量
+        self.flushed = 0
+
+        if path:
+            open(path, 'wb').close()
+
+    def record(self, event: EventType, order: OrderData, pos, trade: TradeData = None):
+        """
+        记录订单事件, 成交事件的时间、价格取自成交记录.
+        所有事件的 volume 都是订单数量(不带符号), 成交后的持仓变化看 pos.
+        """
+        if EVENT_LEVELS[event] < self.level:
+            return
+
+        if self.path:
+            if self.count - self.flushed == len(self.buffer):
+                self.flush()
+            index = self.count - self.flushed
+        else:
+            index = self.count % len(self.buffer)
+
+        source = trade if trade is not None else order
+        dt = source.datetime
+        self.buffer[index] = (
+            event,
+            dt.value if isinstance(dt, pd.Timestamp) else (pd.Timestamp(dt).value if dt is not None else 0),
+            order.order_id,
+            trade.trade_id if trade is not None else 0,
+            DIRECTIONS.index(order.direction),
+            ORDER_TYPES.index(order.type),
+            source.price,
+            order.volume,
+            pos,
+        )
+        self.count += 1
+
+        if self.echo:
+            print(f"{source.datetime}，{event.name} {order.direction.value}: {order.volume}@{source.price}, 持仓：{pos}")
+
+    def flush(self):
+        """
+        把缓冲区中还没写入文件的事件追加到文件.
+        """
+        if not self.path or self.count == self.flushed:
+            return
+        with open(self.path, 'ab') as f:
+            self.buffer[:self.count - self.flushed].tofile(f)
+        self.flushed = self.count
+
+    def events(self) -> np.ndarray:
+        """
+        按时间顺序返回记录的事件.
+        """
+        if self.path:
+            self.flush()
+            return np.fromfile(self.path, dtype=EVENT_DTYPE)
+
+        capacity = len(self.buffer)
+        if self.count <= capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate((self.buffer[start:], self.buffer[:start]))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        events = self.events()
+        return pd.DataFrame({
+            'event': [EventType(code).name for code in events['event']],
+            'datetime': pd.to_datetime(events['datetime']),
+            'order_id': events['order_id'],
+            'trade_id': events['trade_id'],
+            'direction': np.array(DIRECTIONS, dtype=object)[events['direction']],
+            'type': np.array(ORDER_TYPES, dtype=object)[events['type']],
+            'price': events['price'],
+            'volume': events['volume'],
+            'pos': events['pos'],
+        })
+
+    def clear(self):
+        self.count = 0
+        self.flushed = 0
+        if self.path:
+            open(self.path, 'wb').close()
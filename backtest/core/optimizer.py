@@ -0,0 +1,156 @@
+"""
+    多进程参数优化, 回测数据通过共享内存只发送给每个子进程一次.
+"""
+
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# 子进程中的 Broker 和共享内存, 由 init_worker 设置.
+_worker_broker = None
+_worker_shm = None
+
+
+def share_dataframe(df: pd.DataFrame):
+    """
+    把 DataFrame 的数值列和时间列拷贝到一块共享内存中.
+    :param df: 回测数据
+    :return: (共享内存, 布局信息), 布局信息交给 attach_dataframe 还原 DataFrame
+    """
+    arrays = {}
+    others = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if values.dtype.kind in 'biufM':
+            arrays[name] = np.ascontiguousarray(values)
+        else:
+            # 字符串等 object 列无法放入共享内存, 随布局信息发送.
+            others[name] = values
+
+    size = sum(values.nbytes for values in arrays.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    columns = []
+    offset = 0
+    for name, values in arrays.items():
+        view = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=offset)
+        view[:] = values
+        columns.append((name, values.dtype.str, offset, values.shape))
+        offset += values.nbytes
+
+    layout = {
+        'order': list(df.columns),
+        'columns': columns,
+        'others': others,
+        'index': None if isinstance(df.index, pd.RangeIndex) else df.index,
+    }
+    return shm, layout
+
+
+def attach_dataframe(name, layout):
+    """
+    连接共享内存并还原 DataFrame, 数值列直接引用共享内存, 不做拷贝.
+    :param name: 共享内存名称
+    :param layout: share_dataframe 返回的布局信息
+    :return: (共享内存, DataFrame), 使用 DataFrame 期间需要保留共享内存对象的引用
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    data = {}
+    for column, dtype, offset, shape in layout['columns']:
+        values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        values.flags.writeable = False
+        data[column] = values
+    data.update(layout['others'])
+
+    df = pd.DataFrame(data, columns=layout['order'], index=layout['index'], copy=False)
+    return shm, df
+
+
+def init_worker(broker, name, layout):
+    """
+    子进程初始化, 保存 Broker 模板并挂载共享的回测数据.
+    name 为 None 时回测数据从 Broker 的K线存储中按相同的条件查询, 直接使用内存映射.
+    """
+    global _worker_broker, _worker_shm
+    if name is None:
+        broker.set_backtest_data(*broker.backtest_query)
+    else:
+        _worker_shm, data = attach_dataframe(name, layout)
+        broker.set_backtest_data(data)
+    _worker_broker = broker
+
+
+def run_worker(task):
+    """
+    子进程中跑一个回测任务, task 为 broker.run_params 的参数.
+    """
+    return _worker_broker.run_params(*task)
+
+
+class BacktestPool(object):
+    """
+    回测任务池, 进程数为 1 时在当前进程中串行运行, 否则分发给子进程.
+    回测数据在创建进程池时通过共享内存发送给子进程一次, 之后的任务只传递参数.
+    """
+
+    def __init__(self, broker, processes=None, chunksize=1):
+        """
+        :param broker: 设置好策略和回测数据的 Broker
+        :param processes: 进程数, None 表示使用全部 CPU 核心
+        :param chunksize: 每次分发给子进程的任务数量
+        """
+        self.broker = broker
+        self.chunksize = chunksize
+        self.pool = None
+        self.shm = None
+
+        if processes == 1:
+            return
+
+        # 子进程使用的 Broker 模板, 不带回测数据, 回测数据通过共享内存传递.
+        template = copy.copy(broker)
+        template.backtest_data = None
+        template.strategy_instance = None
+        template.trades = []
+        template.journal = None
+
+        # 回测数据来自K线存储中的一个分区时, 子进程各自映射同一份文件, 不再拷贝到共享内存.
+        query = broker.backtest_query
+        if query is not None and broker.kline_store.is_mapped(*query):
+            name, layout = None, None
+        else:
+            self.shm, layout = share_dataframe(broker.backtest_data)
+            name = self.shm.name
+        self.pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                         initargs=(template, name, layout))
+
+    def map(self, tasks):
+        """
+        运行回测任务, 返回结果的顺序与任务顺序一致.
+        :param tasks: 任务列表, 每个任务是 broker.run_params 的参数元组
+        :return: 每个任务的 broker.run_params 结果
+        """
+        if self.pool is None:
+            return [self.broker.run_params(*task) for task in tasks]
+        return self.pool.map(run_worker, tasks, chunksize=self.chunksize)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.pool is not None:
+            self.pool.terminate()
+        self.close()
@@ -0,0 +1,97 @@
+"""
+    挂单簿, 按方向和价格索引挂单, 撮合时只访问满足成交价格的订单.
+"""
+
+import heapq
+
+from .order import Direction, OrderData
+
+
+class PriceHeap(object):
+    """
+    按价格排序的订单堆.
+    descending 为 True 时价格高的在堆顶, 用于 "订单价格 >= 触发价" 就成交的订单,
+    否则价格低的在堆顶, 用于 "订单价格 <= 触发价" 就成交的订单.
+    """
+
+    def __init__(self, descending: bool):
+        self.descending = descending
+        self.heap = []
+
+    def push(self, order: OrderData):
+        price = -order.price if self.descending else order.price
+        heapq.heappush(self.heap, (price, order.order_id, order))
+
+    def pop_crossed(self, price):
+        """
+        弹出所有满足成交价格的订单.
+        """
+        orders = []
+        heap = self.heap
+        if self.descending:
+            while heap and -heap[0][0] >= price:
+                orders.append(heapq.heappop(heap)[2])
+        else:
+            while heap and heap[0][0] <= price:
+                orders.append(heapq.heappop(heap)[2])
+        return orders
+
+    def clear(self):
+        self.heap.clear()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (item[2] for item in self.heap)
+
+
+class OrderBook(object):
+    """
+    挂单簿, 买单(做多/平空)和卖单(做空/平多)分别按价格保存在两个堆中.
+
+    限价单: 买单价格 >= 最低价成交, 卖单价格 <= 最高价成交.
+    止损单: 买单价格 <= 最高价触发, 卖单价格 >= 最低价触发.
+
+    保留了 list 的 append/clear/len/迭代 接口, 迭代时按下单顺序返回订单.
+    """
+
+    def __init__(self, stop: bool = False):
+        """
+        :param stop: True 为止损单簿, False 为限价单簿
+        """
+        self.stop = stop
+        self.buy_orders = PriceHeap(descending=not stop)
+        self.sell_orders = PriceHeap(descending=stop)
+
+    def append(self, order: OrderData):
+        if order.direction == Direction.LONG or order.direction == Direction.COVER:
+            self.buy_orders.push(order)
+        else:
+            self.sell_orders.push(order)
+
+    def cross(self, buy_price, sell_price):
+        """
+        弹出所有满足成交价格的订单, 按下单顺序返回.
+        :param buy_price: 买单的触发价格, 限价单为最低价, 止损单为最高价
+        :param sell_price: 卖单的触发价格, 限价单为最高价, 止损单为最低价
+        :return: 成交的订单列表
+        """
+        orders = []
+        if self.buy_orders.heap and buy_price > 0:
+            orders.extend(self.buy_orders.pop_crossed(buy_price))
+        if self.sell_orders.heap and sell_price > 0:
+            orders.extend(self.sell_orders.pop_crossed(sell_price))
+        if len(orders) > 1:
+            orders.sort(key=lambda order: order.order_id)
+        return orders
+
+    def clear(self):
+        self.buy_orders.clear()
+        self.sell_orders.clear()
+
+    def __len__(self):
+        return len(self.buy_orders) + len(self.sell_orders)
+
+    def __iter__(self):
+        return iter(sorted(list(self.buy_orders) + list(self.sell_orders), key=lambda order: order.order_id))
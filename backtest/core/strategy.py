@@ -4,6 +4,7 @@
 
 import numpy as np
 import pandas as pd
+from .array_manager import ArrayManager, PrecomputedArrayManager
 from .data import BarData
 from .order import *
 
@@ -14,9 +15,27 @@ class BaseStrategy(object):
 
     record_data = pd.DataFrame()
 
+    # 是否对全部回测数据预先计算指标, Broker 在创建策略实例之后、on_start 之前按 set_precompute_indicators 设置.
+    precompute_indicators = False
+
+    # 预热K线数量, 回测开始时前 warmup_bars 根K线一次性交给 on_history, 不再逐根调用 next_bar.
+    warmup_bars = 0
+
     def __init__(self, data: pd.DataFrame):
         super(BaseStrategy, self).__init__()
         self.data = data
+        # 每个策略实例单独记录, 避免参数优化时多次回测共用同一份记录.
+        self.record_data = pd.DataFrame()
+
+    def new_array_manager(self, size=500) -> ArrayManager:
+        """
+        创建 ArrayManager, 预先计算指标时创建 PrecomputedArrayManager.
+        需要在 on_start 中调用, 在 __init__ 中调用时还没有 Broker 的设置, 总是创建 ArrayManager.
+        :param size: K线窗口长度
+        """
+        if self.precompute_indicators:
+            return PrecomputedArrayManager(self.data, size)
+        return ArrayManager(size)
 
     def record(self, index, **kwargs):
         """
@@ -36,6 +55,13 @@ class BaseStrategy(object):
         """
         self.record_data.to_csv(path)
 
+    def write_log(self, msg):
+        """
+        输出日志, 参数优化时不输出.
+        :param msg: 日志内容
+        """
+        self.broker.output(msg)
+
     def on_start(self):
         """
         策略开始运行.
@@ -48,6 +74,13 @@ class BaseStrategy(object):
         :return:
         """
 
+    def on_history(self, data: pd.DataFrame):
+        """
+        预热历史数据, warmup_bars 大于 0 时在 on_start 之后调用, 一般用 ArrayManager.update_bars 批量加载.
+        :param data: 前 warmup_bars 根K线
+        :return:
+        """
+
     def next_bar(self, bar: BarData):
         raise NotImplementedError("请在子类中实现该方法..")
 
@@ -0,0 +1,297 @@
+"""
+    增量指标, 每根新K线以 O(1) 更新, 不需要对整个窗口重新计算.
+
+    指标的初始化方式与 talib 一致, 但 talib 每次都从窗口起点开始计算, 而增量指标从注册时开始一直累积,
+    所以 EMA 类指标在窗口长度远大于周期时与 talib 的结果只有可以忽略的差别.
+"""
+
+from collections import deque
+from math import sqrt, nan
+
+
+class StreamingIndicator(object):
+    """
+    增量指标基类.
+    """
+
+    def __init__(self):
+        self.value = nan
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        raise NotImplementedError("请在子类中实现该方法..")
+
+    def seed(self, open_array, high_array, low_array, close_array, volume_array):
+        """
+        用历史数据初始化指标.
+        """
+        for values in zip(open_array.tolist(), high_array.tolist(), low_array.tolist(),
+                          close_array.tolist(), volume_array.tolist()):
+            self.update(*values)
+
+
+class SMA(StreamingIndicator):
+    """
+    Simple moving average, 滑动窗口求和.
+    """
+
+    def __init__(self, n):
+        super(SMA, self).__init__()
+        self.n = n
+        self.window = deque()
+        self.total = 0.0
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        self.window.append(close_price)
+        self.total += close_price
+        if len(self.window) > self.n:
+            self.total -= self.window.popleft()
+        if len(self.window) == self.n:
+            self.value = self.total / self.n
+
+
+class STD(StreamingIndicator):
+    """
+    Standard deviation, 滑动窗口的和与平方和, 与 talib.STDDEV 一样计算总体标准差.
+    """
+
+    def __init__(self, n):
+        super(STD, self).__init__()
+        self.n = n
+        self.window = deque()
+        self.total = 0.0
+        self.total_square = 0.0
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        self.window.append(close_price)
+        self.total += close_price
+        self.total_square += close_price * close_price
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            self.total -= old
+            self.total_square -= old * old
+        if len(self.window) == self.n:
+            mean = self.total / self.n
+            variance = self.total_square / self.n - mean * mean
+            self.value = sqrt(variance) if variance > 0 else 0.0
+
+
+class EMA(StreamingIndicator):
+    """
+    Exponential moving average, 用前 n 个值的简单平均初始化.
+    """
+
+    def __init__(self, n):
+        super(EMA, self).__init__()
+        self.n = n
+        self.k = 2 / (n + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def update_value(self, price):
+        self.count += 1
+        if self.count < self.n:
+            self.total += price
+        elif self.count == self.n:
+            self.value = (self.total + price) / self.n
+        else:
+            self.value += (price - self.value) * self.k
+        return self.value
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        self.update_value(close_price)
+
+
+class MACD(StreamingIndicator):
+    """
+    MACD, value 为 (macd, signal, hist).
+    """
+
+    def __init__(self, fast_period, slow_period, signal_period):
+        super(MACD, self).__init__()
+        self.fast = EMA(fast_period)
+        self.slow = EMA(slow_period)
+        self.signal = EMA(signal_period)
+        self.value = (nan, nan, nan)
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        fast = self.fast.update_value(close_price)
+        slow = self.slow.update_value(close_price)
+        if slow != slow:
+            return
+
+        macd = fast - slow
+        signal = self.signal.update_value(macd)
+        self.value = (macd, signal, macd - signal)
+
+
+class ATR(StreamingIndicator):
+    """
+    Average True Range, Wilder 平滑.
+    """
+
+    def __init__(self, n):
+        super(ATR, self).__init__()
+        self.n = n
+        self.pre_close = None
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        pre_close = self.pre_close
+        self.pre_close = close_price
+        if pre_close is None:
+            return
+
+        tr = max(high_price - low_price, abs(high_price - pre_close), abs(low_price - pre_close))
+        self.count += 1
+        if self.count < self.n:
+            self.total += tr
+        elif self.count == self.n:
+            self.value = (self.total + tr) / self.n
+        else:
+            self.value = (self.value * (self.n - 1) + tr) / self.n
+
+
+class RSI(StreamingIndicator):
+    """
+    Relative Strength Index, Wilder 平滑.
+    """
+
+    def __init__(self, n):
+        super(RSI, self).__init__()
+        self.n = n
+        self.pre_close = None
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        pre_close = self.pre_close
+        self.pre_close = close_price
+        if pre_close is None:
+            return
+
+        change = close_price - pre_close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+
+        self.count += 1
+        if self.count <= self.n:
+            self.gain += gain
+            self.loss += loss
+            if self.count < self.n:
+                return
+            self.gain /= self.n
+            self.loss /= self.n
+        else:
+            self.gain = (self.gain * (self.n - 1) + gain) / self.n
+            self.loss = (self.loss * (self.n - 1) + loss) / self.n
+
+        total = self.gain + self.loss
+        self.value = 100 * self.gain / total if total else 0.0
+
+
+class ADX(StreamingIndicator):
+    """
+    Average Directional Movement Index, Wilder 平滑.
+    """
+
+    def __init__(self, n):
+        super(ADX, self).__init__()
+        self.n = n
+        self.pre_bar = None
+        self.count = 0
+        self.plus_dm = 0.0
+        self.minus_dm = 0.0
+        self.tr = 0.0
+        self.dx_count = 0
+        self.dx_total = 0.0
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        pre_bar = self.pre_bar
+        self.pre_bar = (high_price, low_price, close_price)
+        if pre_bar is None:
+            return
+        pre_high, pre_low, pre_close = pre_bar
+
+        up = high_price - pre_high
+        down = pre_low - low_price
+        plus_dm = up if up > 0 and up > down else 0.0
+        minus_dm = down if down > 0 and down > up else 0.0
+        tr = max(high_price - low_price, abs(high_price - pre_close), abs(low_price - pre_close))
+
+        # 前 n-1 个值直接求和, 之后按 Wilder 方式平滑累计值
+        n = self.n
+        self.count += 1
+        if self.count < n:
+            self.plus_dm += plus_dm
+            self.minus_dm += minus_dm
+            self.tr += tr
+            return
+        self.plus_dm = self.plus_dm - self.plus_dm / n + plus_dm
+        self.minus_dm = self.minus_dm - self.minus_dm / n + minus_dm
+        self.tr = self.tr - self.tr / n + tr
+
+        if self.tr:
+            plus_di = 100 * self.plus_dm / self.tr
+            minus_di = 100 * self.minus_dm / self.tr
+            total = plus_di + minus_di
+            dx = 100 * abs(plus_di - minus_di) / total if total else 0.0
+        else:
+            dx = 0.0
+
+        self.dx_count += 1
+        if self.dx_count < n:
+            self.dx_total += dx
+        elif self.dx_count == n:
+            self.value = (self.dx_total + dx) / n
+        else:
+            self.value = (self.value * (n - 1) + dx) / n
+
+
+class Donchian(StreamingIndicator):
+    """
+    Donchian Channel, 单调队列维护窗口内的最高价和最低价, value 为 (up, down).
+    """
+
+    def __init__(self, n):
+        super(Donchian, self).__init__()
+        self.n = n
+        self.count = 0
+        # (序号, 价格), 最高价队列单调递减, 最低价队列单调递增
+        self.highs = deque()
+        self.lows = deque()
+        self.value = (nan, nan)
+
+    def update(self, open_price, high_price, low_price, close_price, volume):
+        index = self.count
+        self.count += 1
+
+        highs = self.highs
+        while highs and highs[-1][1] <= high_price:
+            highs.pop()
+        highs.append((index, high_price))
+        if highs[0][0] <= index - self.n:
+            highs.popleft()
+
+        lows = self.lows
+        while lows and lows[-1][1] >= low_price:
+            lows.pop()
+        lows.append((index, low_price))
+        if lows[0][0] <= index - self.n:
+            lows.popleft()
+
+        if self.count >= self.n:
+            self.value = (highs[0][1], lows[0][1])
+
+
+STREAMING_INDICATORS = {
+    'sma': SMA,
+    'std': STD,
+    'ema': EMA,
+    'macd': MACD,
+    'atr': ATR,
+    'rsi': RSI,
+    'adx': ADX,
+    'donchian': Donchian,
+}
@@ -0,0 +1,55 @@
+"""
+    向量化回测, 根据仓位序列一次性计算资金曲线和成交记录.
+"""
+
+import numpy as np
+
+# 成交记录的字段: K线下标, 成交价格, 成交数量(正数做多/平空, 负数做空/平多), 成交后的持仓
+TRADE_DTYPE = np.dtype([('index', np.int64), ('price', np.float64), ('volume', np.float64), ('pos', np.float64)])
+
+
+def vectorized_backtest(open_price, close_price, pos, cash=1_000_000, commission=7 / 10000,
+                        slipper_rate=5 / 10000, leverage=1.0):
+    """
+    根据目标持仓序列向量化计算资金曲线.
+
+    成交约定, 与 Broker.cross_limit_order 对照:
+    1. pos[i] 是第 i 根K线开盘时的目标持仓. 与 signal_moving_average 一样, 信号在K线收盘后产生,
+       到下一根K线开盘时仓位才改变, 所以调用前需要把信号 shift 一根K线.
+    2. 仓位变化等价于上一根K线收盘后挂出一个必定成交的限价单 (买单价格 >= 开盘价, 卖单价格 <= 开盘价),
+       cross_limit_order 的成交价为 min(order.price, open) / max(order.price, open), 即第 i 根K线的开盘价.
+    3. 手续费和滑点与 Broker.calculate 一致: 成交额 = |成交数量 * 杠杆 * 成交价|,
+       费用 = 成交额 * (commission + slipper_rate), 杠杆只影响费用, 不影响盈亏.
+    4. 资金曲线按每根K线收盘价逐根盯市, 而不是只在持仓回到0时才结算.
+
+    :param open_price: 开盘价数组
+    :param close_price: 收盘价数组
+    :param pos: 目标持仓数组, NaN 视为空仓
+    :param cash: 初始本金
+    :param commission: 手续费率
+    :param slipper_rate: 滑点率
+    :param leverage: 杠杆比例
+    :return: (equity, trades), equity 为每根K线收盘后的权益, trades 为 TRADE_DTYPE 的结构化数组
+    """
+    open_price = np.asarray(open_price, dtype=np.float64)
+    close_price = np.asarray(close_price, dtype=np.float64)
+    pos = np.nan_to_num(np.asarray(pos, dtype=np.float64))
+
+    # 开盘前的持仓和上一根K线的收盘价
+    prev_pos = np.concatenate(([0.0], pos[:-1]))
+    prev_close = np.concatenate((open_price[:1], close_price[:-1]))
+    change = pos - prev_pos
+
+    # 盈亏 = 旧持仓从上一根收盘到开盘的跳空 + 新持仓从开盘到收盘的变化
+    pnl = prev_pos * (open_price - prev_close) + pos * (close_price - open_price)
+    fee = np.abs(change * leverage * open_price) * (commission + slipper_rate)
+    equity = cash + np.cumsum(pnl - fee)
+
+    index = np.flatnonzero(change)
+    trades = np.empty(len(index), dtype=TRADE_DTYPE)
+    trades['index'] = index
+    trades['price'] = open_price[index]
+    trades['volume'] = change[index]
+    trades['pos'] = pos[index]
+
+    return equity, trades
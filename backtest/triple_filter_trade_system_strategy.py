@@ -4,13 +4,12 @@
     -
 """
 
-from backtest.core import Broker, BaseStrategy, BarData, ArrayManager
+from backtest.core import Broker, BaseStrategy, BarData, EventJournal
 import pandas as pd
 
-from backtest.core.bar_generater import BarGenerator
+from backtest.core.bar_generater import BarGeneratorHub
 from backtest.core.order import Direction
 from common.indicator import EMA, EFI
-from common.kline_utils import period
 import talib
 import numpy as np
 from datetime import datetime
@@ -62,10 +61,13 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
     macd_slow_period = 26
     macd_signal_period = 9
 
-    # 用于统计平均EMA穿透值的队列
+    # 用于统计平均EMA穿透值的队列长度
     ema_break_queue_size = 15
-    ema_break_down = Queue(ema_break_queue_size)
-    ema_break_up = Queue(ema_break_queue_size)
+
+    # K线窗口长度
+    am_size = 1050
+    # 预热K线数量, 预热后的下一根K线 ArrayManager 刚好 inited
+    warmup_bars = am_size - 1
 
     # 做多趋势，持续在EMA以下挂单买入
     keep_buy = False
@@ -74,8 +76,6 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
 
     # 当前趋势
     trend = None
-    # 信号集合
-    signals = []
 
     # 最高点
     max_high = None
@@ -84,17 +84,22 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
 
     def __init__(self, data):
         super(TripleFilterTradeSystemStrategy, self).__init__(data)
-        self.am = ArrayManager(size=1050)  # 计算产生的信号..
+        self.am = None  # 计算产生的信号, 在 on_start 中创建..
+
+        # 可变对象在每个实例中单独创建, 避免参数优化时多次回测互相影响
+        # 用于统计平均EMA穿透值的队列
+        self.ema_break_down = Queue(self.ema_break_queue_size)
+        self.ema_break_up = Queue(self.ema_break_queue_size)
+        # 信号集合
+        self.signals = []
 
         self.middle_period = self.params['middle_period']
         self.long_period = self.params['long_period']
 
-        # 长周期K线回调
-        self.bg_long = BarGenerator(self.long_period, self.on_long_bar)
-        # 中中期K线回调
-        self.bg_middle = BarGenerator(self.middle_period, self.on_middle_bar)
-
-        print("策略参数：%s" % self.params)
+        # 长周期、中周期K线回调, 共用一个K线合成器
+        self.bg = BarGeneratorHub()
+        self.bg.subscribe(self.long_period, self.on_long_bar)
+        self.bg.subscribe(self.middle_period, self.on_middle_bar)
 
     def get_trade_amount(self):
         """
@@ -104,10 +109,15 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
         # return self.broker.cash * self.params['trade_percent']
 
     def on_start(self):
-        print("策略开始运行..")
+        self.am = self.new_array_manager(size=self.am_size)
+        self.write_log("策略参数：%s" % self.params)
+        self.write_log("策略开始运行..")
 
     def on_stop(self):
-        print("策略停止运行..")
+        self.write_log("策略停止运行..")
+
+    def on_history(self, data: pd.DataFrame):
+        self.am.update_bars(data)
 
     def next_bar(self, bar: BarData):
         """
@@ -123,29 +133,30 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
 
         # print('minute', bar)
 
-        df = self.am.get_dataframe()
+        frame = self.am.frame
+        high = frame.last('high')
+        low = frame.last('low')
 
-        self.bg_long.update_bar(bar)
-        self.bg_middle.update_bar(bar)
+        self.bg.update_bar(bar)
 
         # 开仓后记录最高点和最低点
         if self.pos > 0:
-            if self.max_high is None or df.high.iloc[-1] > self.max_high:
-                self.max_high = df.high.iloc[-1]
+            if self.max_high is None or high > self.max_high:
+                self.max_high = high
         elif self.pos < 0:
-            if self.min_low is None or df.low.iloc[-1] < self.min_low:
-                self.min_low = df.low.iloc[-1]
+            if self.min_low is None or low < self.min_low:
+                self.min_low = low
         else:
             # 平仓后重置最高点和最低点
             self.max_high = None
             self.min_low = None
 
         # 高位回撤自动止盈
-        if self.max_high and df.low.iloc[-1] <= self.max_high * (1 - self.params['fall_back_percent']):
+        if self.max_high and low <= self.max_high * (1 - self.params['fall_back_percent']):
             self.signals.append('sell')
 
         # 低位回升自动止盈
-        if self.min_low and df.high.iloc[-1] >= self.min_low * (1 + self.params['fall_back_percent']):
+        if self.min_low and high >= self.min_low * (1 + self.params['fall_back_percent']):
             self.signals.append('cover')
 
         # 处理交易信号
@@ -156,14 +167,13 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
         长周期行情数据回调
         """
 
-        # 周期数据转换
-        df = period(self.am.get_dataframe(), '%sT' % self.long_period, 'open_time')
-        if df.index.__len__() < 2:
+        # 长周期K线
+        long_bars = self.am.tf('%sT' % self.long_period)
+        if len(long_bars) < 2:
             return
-        # print('long', df.tail(n=1))
 
         # 计算长周期MACD
-        macd, signal, hist = talib.MACD(df['close'].to_numpy(), self.macd_fast_period, self.macd_slow_period, self.macd_signal_period)
+        macd, signal, hist = talib.MACD(long_bars.close, self.macd_fast_period, self.macd_slow_period, self.macd_signal_period)
 
         # 判断当前趋势
         if hist[-1] and hist[-2]:
@@ -191,8 +201,8 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
         """
         中周期行情数据回调
         """
-        # 周期数据转换
-        df = period(self.am.get_dataframe(), '%sT' % self.middle_period, 'open_time')
+        # 中周期K线
+        df = self.am.tf('%sT' % self.middle_period).to_dataframe()
         # print('middle', df.tail(n=1))
 
         # 持续在EMA下买入
@@ -345,30 +355,10 @@ class TripleFilterTradeSystemStrategy(BaseStrategy):
 
 
 if __name__ == '__main__':
-    from common.time_utils import timestamp_to_datetime
-
-    # 读取分钟数据
-    df = pd.read_csv('ETHUSDT-1m.csv', converters={
-        'Open time': timestamp_to_datetime,
-        'Close time': timestamp_to_datetime
-    })
-
-    # 数据清洗
-    df.rename(columns={
-        'Open time': 'open_time',
-        'Close time': 'close_time',
-        'Open': 'open',
-        'High': 'high',
-        'Low': 'low',
-        'Close': 'close',
-        'Volume': 'volume',
-    }, inplace=True)
-
-    # 截取指定时间范围的数据
-    df = df[df['open_time'] >= '2021-05-01']
-    df = df[df['close_time'] <= '2021-06-01']
-
-    df.reset_index(inplace=True, drop=True)
+    from common.kline_loader import load_klines
+
+    # 读取指定时间范围的分钟数据
+    df = load_klines('ETHUSDT-1m.csv', start='2021-05-01', end='2021-06-01')
     # print(df)
 
     broker = Broker()
@@ -378,9 +368,15 @@ if __name__ == '__main__':
     broker.set_cash(3600)  # 1初始资金.
     broker.set_commission(7 / 10000)  # 手续费
     broker.set_backtest_data(df)  # 数据.
+    broker.set_columnar_feed(True)  # 策略不保存 bar 对象, 可以使用列式数据.
+    broker.set_journal(EventJournal())  # 订单事件日志
     broker.run()
     broker.calculate().to_csv('triple_filter_trade_system_backtest.csv', index=False)
+    broker.journal.to_dataframe().to_csv('triple_filter_trade_system_events.csv', index=False)
     broker.output_record('triple_filter_trade_system_record.csv')
 
     # 参数优化， 穷举法， 遗传算法。
-    # broker.optimize_strategy(long_period=[i for i in range(30, 60, 5)], short_period=[i for i in range(5, 30, 1)])
+    # broker.optimize_strategy(long_period=[i for i in range(30, 60, 5)], middle_period=[i for i in range(5, 30, 1)],
+    #                          processes=None, chunksize=4)
+    # broker.optimize_genetic(budget=300, processes=None, long_period=[i for i in range(30, 60, 5)],
+    #                         middle_period=[i for i in range(5, 30, 1)], stop_percent=[i / 100 for i in range(1, 6)])
@@ -0,0 +1,110 @@
+"""
+    K线数据加载, 读取币安导出的K线 CSV 文件, 支持 gzip/zip 压缩文件和多个月度文件.
+"""
+
+import glob
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from common.time_utils import timestamps_to_datetimes
+
+# 币安K线文件的列, 已转换为回测使用的列名
+KLINE_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+                 'quote_volume', 'trades', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+
+KLINE_DTYPES = {
+    'open_time': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,
+    'close_time': np.int64,
+    'quote_volume': np.float64,
+    'trades': np.int64,
+    'taker_buy_volume': np.float64,
+    'taker_buy_quote_volume': np.float64,
+    'ignore': np.float64,
+}
+
+
+def timestamp_unit(values: np.ndarray) -> str:
+    """
+    根据数量级判断时间戳的单位, 币安从 2025 年起部分数据使用微秒时间戳.
+    """
+    if len(values) and np.abs(values).max() >= 10 ** 14:
+        return 'us'
+    return 'ms'
+
+
+def read_kline_csv(source) -> pd.DataFrame:
+    """
+    读取一个K线 CSV, 第一个单元格不是数字时认为有表头, 比如现货的 'Open time' 或合约的 'open_time'.
+    时间戳的单位按每个文件单独判断, 币安的 2024-12 和 2025-01 文件分别为毫秒和微秒.
+    :param source: 文件路径或文件对象, .gz/.zip 文件按扩展名自动解压
+    :return: 使用 KLINE_COLUMNS 列名的 DataFrame, 时间列为本地时间
+    """
+    df = pd.read_csv(source, header=None, names=KLINE_COLUMNS, dtype=str, nrows=1)
+    header = len(df) and not df['open_time'].iloc[0].strip().isdigit()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+    df = pd.read_csv(source, header=0 if header else None, names=KLINE_COLUMNS, dtype=KLINE_DTYPES,
+                     engine='c')
+    for column in ('open_time', 'close_time'):
+        values = df[column].to_numpy()
+        df[column] = timestamps_to_datetimes(values, timestamp_unit(values))
+    return df
+
+
+def read_kline_file(path) -> pd.DataFrame:
+    """
+    读取一个K线文件, zip 文件中的每个 CSV 都会被读取.
+    """
+    if str(path).endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            frames = []
+            for name in sorted(archive.namelist()):
+                if name.endswith('.csv'):
+                    frames.append(read_kline_csv(io.BytesIO(archive.read(name))))
+        if not frames:
+            raise ValueError(f"{path} 中没有 CSV 文件")
+        return pd.concat(frames, ignore_index=True)
+    return read_kline_csv(path)
+
+
+def slice_klines(df: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    """
+    按时间范围截取按时间排序的K线, 保留 open_time >= start 且 close_time <= end 的K线.
+    在排序的时间列上二分查找, 不逐行比较.
+    """
+    lo = 0 if start is None else np.searchsorted(df['open_time'].to_numpy(), np.datetime64(pd.Timestamp(start)), 'left')
+    hi = len(df) if end is None else np.searchsorted(df['close_time'].to_numpy(), np.datetime64(pd.Timestamp(end)), 'right')
+    return df.iloc[lo:max(lo, hi)].reset_index(drop=True)
+
+
+def load_klines(paths, start=None, end=None) -> pd.DataFrame:
+    """
+    读取K线文件, 转换为回测数据.
+    :param paths: 文件路径、通配符或它们的列表, 比如 'ETHUSDT-1m-2021-*.zip'
+    :param start: 开始时间, 保留 open_time >= start 的K线
+    :param end: 结束时间, 保留 close_time <= end 的K线
+    :return: open_time/open/high/low/close/volume/close_time/... 的 DataFrame,
+             时间列为本地时间, 精确到秒, 与 timestamp_to_datetime 的结果相同
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(path)) or [path])
+
+    df = pd.concat([read_kline_file(path) for path in files], ignore_index=True)
+
+    # 多个文件可能有重叠或顺序不对
+    if not df['open_time'].is_monotonic_increasing or df['open_time'].duplicated().any():
+        df = df.drop_duplicates('open_time', keep='last').sort_values('open_time', kind='mergesort')
+
+    return slice_klines(df.reset_index(drop=True), start, end)
@@ -0,0 +1,203 @@
+"""
+    本地K线存储, 按 交易对/周期/月份 分区, 每列保存为一个 .npy 文件, 查询时用内存映射打开.
+
+    目录结构: root/ETHUSDT/1m/2021-05/open_time.npy, open.npy, ...
+    同一个月份内的查询直接返回内存映射上的切片, 不拷贝数据, 多个进程读取同一份文件时共用系统的页缓存.
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# 存储的列, open_time 为 datetime64[ns], 其余为 float64
+STORE_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume']
+
+STORE_DTYPES = {
+    'open_time': np.dtype('datetime64[ns]'),
+    'open': np.dtype(np.float64),
+    'high': np.dtype(np.float64),
+    'low': np.dtype(np.float64),
+    'close': np.dtype(np.float64),
+    'volume': np.dtype(np.float64),
+}
+
+
+def month_of(value) -> str:
+    """
+    时间所在的月份分区名称, 比如 '2021-05'.
+    """
+    return str(np.datetime64(pd.Timestamp(value), 'M'))
+
+
+class KlineStore(object):
+    """
+    按月分区的K线存储.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: 存储目录
+        """
+        self.root = root
+
+    def path(self, symbol, interval='1m', month=None):
+        """
+        交易对/周期的目录, month 不为 None 时为该月份分区的目录.
+        交易对中的 '/' 会被去掉, 'ETH/USDT' 与 'ETHUSDT' 使用同一个目录.
+        """
+        path = os.path.join(self.root, symbol.replace('/', ''), interval)
+        return path if month is None else os.path.join(path, month)
+
+    def partitions(self, symbol, interval='1m', start=None, end=None) -> list:
+        """
+        已有的月份分区, 按时间排序.
+        :param start: 只返回包含 start 之后K线的分区
+        :param end: 只返回包含 end 之前K线的分区
+        """
+        path = self.path(symbol, interval)
+        if not os.path.isdir(path):
+            return []
+
+        # 跳过写入中的 .tmp 和替换中的 .old 目录
+        months = sorted(name for name in os.listdir(path)
+                        if '.' not in name and os.path.isfile(os.path.join(path, name, 'open_time.npy')))
+        if start is not None:
+            months = [month for month in months if month >= month_of(start)]
+        if end is not None:
+            months = [month for month in months if month <= month_of(end)]
+        return months
+
+    def read(self, symbol, interval, month, mmap_mode='r') -> dict:
+        """
+        读取一个分区的所有列.
+        :param mmap_mode: 内存映射模式, None 表示读入内存
+        """
+        path = self.path(symbol, interval, month)
+        return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in STORE_COLUMNS}
+
+    def query_parts(self, symbol, start=None, end=None, interval='1m') -> list:
+        """
+        查询范围在每个分区中的内存映射切片, 只包含有K线的分区.
+        :return: [{列名: 数组}, ...], 按时间排序
+        """
+        start = None if start is None else np.datetime64(pd.Timestamp(start), 'ns')
+        end = None if end is None else np.datetime64(pd.Timestamp(end), 'ns')
+
+        parts = []
+        for month in self.partitions(symbol, interval, start, end):
+            columns = self.read(symbol, interval, month)
+            open_time = columns['open_time']
+            lo = 0 if start is None else np.searchsorted(open_time, start, 'left')
+            hi = len(open_time) if end is None else np.searchsorted(open_time, end, 'left')
+            if hi > lo:
+                parts.append({name: values[lo:hi] for name, values in columns.items()})
+        return parts
+
+    def query(self, symbol, start=None, end=None, interval='1m') -> pd.DataFrame:
+        """
+        查询K线, 保留 open_time >= start 且 open_time < end 的K线.
+        在一个分区内的查询返回内存映射上的只读切片, 跨分区时只拷贝查询范围内的数据.
+        :param symbol: 交易对
+        :param start: 开始时间, None 表示从最早的K线开始
+        :param end: 结束时间, None 表示到最新的K线
+        :param interval: K线周期
+        :return: open_time/open/high/low/close/volume 的 DataFrame
+        """
+        parts = self.query_parts(symbol, start, end, interval)
+        if not parts:
+            data = {name: np.empty(0, dtype=dtype) for name, dtype in STORE_DTYPES.items()}
+        elif len(parts) == 1:
+            data = parts[0]
+        else:
+            data = {name: np.concatenate([part[name] for part in parts]) for name in STORE_COLUMNS}
+        return pd.DataFrame(data, columns=STORE_COLUMNS, copy=False)
+
+    def is_mapped(self, symbol, start=None, end=None, interval='1m') -> bool:
+        """
+        query 的结果是否直接引用内存映射, 即查询范围内的K线都在同一个分区中.
+        end 不包含在查询范围内, ('2021-05-01', '2021-06-01') 只涉及 2021-05 分区.
+        """
+        return len(self.query_parts(symbol, start, end, interval)) <= 1
+
+    def last_time(self, symbol, interval='1m'):
+        """
+        最新一根K线的 open_time, 没有数据时返回 None.
+        """
+        months = self.partitions(symbol, interval)
+        if not months:
+            return None
+        open_time = np.load(os.path.join(self.path(symbol, interval, months[-1]), 'open_time.npy'), mmap_mode='r')
+        return pd.Timestamp(open_time[-1]) if len(open_time) else None
+
+    def append(self, symbol, data: pd.DataFrame, interval='1m') -> list:
+        """
+        写入K线, 与已有K线合并, open_time 相同时以新数据为准.
+        只重写有新数据或数据有变化的月份分区.
+        :param symbol: 交易对
+        :param data: 包含 open_time/open/high/low/close/volume 列的 DataFrame
+        :param interval: K线周期
+        :return: 重写的月份分区
+        """
+        if not len(data):
+            return []
+
+        columns = {name: np.asarray(data[name], dtype=dtype) for name, dtype in STORE_DTYPES.items()}
+        months = columns['open_time'].astype('datetime64[M]')
+        order = np.argsort(months, kind='stable')
+        months = months[order]
+        bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+
+        written = []
+        for rows in np.split(order, bounds):
+            new = {name: values[rows] for name, values in columns.items()}
+            month = str(new['open_time'][0].astype('datetime64[M]'))
+            if self.write_partition(symbol, interval, month, new):
+                written.append(month)
+        return written
+
+    def write_partition(self, symbol, interval, month, new: dict) -> bool:
+        """
+        把新数据合并进一个月份分区, 数据没有变化时不写文件.
+        先写入临时目录再替换原分区, 写入中途中断不会破坏已有数据.
+        :return: 是否写入
+        """
+        path = self.path(symbol, interval, month)
+        stale = path + '.old'
+        if not os.path.exists(path) and os.path.exists(stale):
+            # 上一次替换分区时中断, 恢复原分区
+            os.rename(stale, path)
+
+        old = self.read(symbol, interval, month, mmap_mode=None) if os.path.isfile(
+            os.path.join(path, 'open_time.npy')) else None
+
+        if old is None:
+            merged = new
+        else:
+            merged = {name: np.concatenate([old[name], new[name]]) for name in STORE_COLUMNS}
+
+        # 按 open_time 排序去重, 相同时间保留最后写入的K线
+        open_time = merged['open_time']
+        order = np.argsort(open_time, kind='stable')
+        open_time = open_time[order]
+        keep = np.append(open_time[1:] != open_time[:-1], True)
+        merged = {name: values[order][keep] for name, values in merged.items()}
+
+        if old is not None and all(np.array_equal(old[name], merged[name], equal_nan=True) for name in STORE_COLUMNS):
+            return False
+
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in STORE_COLUMNS:
+            np.save(os.path.join(tmp, name + '.npy'), merged[name])
+
+        if os.path.exists(path):
+            shutil.rmtree(stale, ignore_errors=True)
+            os.rename(path, stale)
+            os.rename(tmp, path)
+            shutil.rmtree(stale)
+        else:
+            os.rename(tmp, path)
+        return True
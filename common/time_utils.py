@@ -1,5 +1,9 @@
+import time
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+
 
 def timestamp_to_datetime(timestamp, unit='ms') -> datetime:
     if unit == 'ms':
@@ -7,3 +11,29 @@ def timestamp_to_datetime(timestamp, unit='ms') -> datetime:
     else:
         return datetime.fromtimestamp(int(timestamp))
 
+
+def datetime_to_timestamp(value, unit='ms') -> int:
+    """
+    timestamp_to_datetime 的逆运算, 把本地时间转换为时间戳.
+    :param value: 本地时间, datetime / pd.Timestamp / 'YYYY-mm-dd HH:MM:SS' 字符串
+    :param unit: 'ms' 毫秒 / 's' 秒
+    """
+    value = pd.Timestamp(value)
+    seconds = int(time.mktime(value.timetuple()))
+    return seconds * 1000 + value.microsecond // 1000 if unit == 'ms' else seconds
+
+
+def timestamps_to_datetimes(timestamps, unit='ms') -> np.ndarray:
+    """
+    timestamp_to_datetime 的向量化版本, 把时间戳数组转换为本地时间的 datetime64[ns] 数组, 精确到秒.
+    本地时区的偏移按每 15 分钟取一次, 夏令时切换也能得到与 datetime.fromtimestamp 相同的结果.
+    :param timestamps: 整数时间戳数组
+    :param unit: 'ms' 毫秒 / 'us' 微秒 / 'ns' 纳秒 / 's' 秒
+    """
+    divisor = {'s': 1, 'ms': 1000, 'us': 1000_000, 'ns': 1000_000_000}[unit]
+    seconds = np.asarray(timestamps, dtype=np.int64) // divisor
+
+    quarters, inverse = np.unique(seconds // 900, return_inverse=True)
+    offsets = np.array([time.localtime(int(quarter) * 900).tm_gmtoff for quarter in quarters], dtype=np.int64)
+    local = seconds + offsets[inverse].reshape(seconds.shape)
+    return local.astype('datetime64[s]').astype('datetime64[ns]')
@@ -0,0 +1,162 @@
+"""
+    历史K线下载, 通过 exchange.fetch_ohlcv 分页向后拉取, 写入本地K线存储.
+    每次从存储中最新的K线开始下载, 中断后重新运行即可继续, 已下载的数据不会重复请求.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common.kline_store import KlineStore
+from common.time_utils import datetime_to_timestamp, timestamps_to_datetimes
+
+
+class RateLimiter(object):
+    """
+    多个线程共用的请求限速, 相邻两次请求至少间隔 interval 秒.
+    """
+
+    def __init__(self, interval):
+        """
+        :param interval: 请求间隔, 秒
+        """
+        self.interval = interval
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        等待到下一次可以发送请求的时间.
+        """
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def ohlcv_to_dataframe(rows) -> pd.DataFrame:
+    """
+    把 fetch_ohlcv 返回的 [[毫秒时间戳, open, high, low, close, volume], ...] 转换为回测数据,
+    open_time 为本地时间, 与 common.kline_loader 读取的K线相同.
+    """
+    values = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+    return pd.DataFrame({
+        'open_time': timestamps_to_datetimes(values[:, 0].astype(np.int64)),
+        'open': values[:, 1],
+        'high': values[:, 2],
+        'low': values[:, 3],
+        'close': values[:, 4],
+        'volume': values[:, 5],
+    })
+
+
+class KlineDownloader(object):
+    """
+    K线下载器, 多个交易对并发下载, 共用交易所的请求限速.
+
+    exchange 只需要实现 fetch_ohlcv(symbol, timeframe, since, limit) 和 rateLimit（毫秒）,
+    ccxt 的交易所对象或者测试用的模拟对象都可以.
+    """
+
+    def __init__(self, exchange, store: KlineStore, interval='1m', limit=1000, retries=5, flush_rows=10000):
+        """
+        :param exchange: 交易所
+        :param store: 本地K线存储
+        :param interval: K线周期, 比如 '1m'
+        :param limit: 每次请求的K线数量
+        :param retries: 请求出错时的重试次数
+        :param flush_rows: 每下载这么多根K线写入一次存储, 中断时最多丢失这么多根K线
+        """
+        self.exchange = exchange
+        self.store = store
+        self.interval = interval
+        self.limit = limit
+        self.retries = retries
+        self.flush_rows = flush_rows
+        self.rate_limiter = RateLimiter(getattr(exchange, 'rateLimit', 0) / 1000)
+
+    def fetch(self, symbol, since):
+        """
+        请求一页K线, 出错时重试.
+        """
+        for i in range(self.retries + 1):
+            self.rate_limiter.wait()
+            try:
+                return self.exchange.fetch_ohlcv(symbol, timeframe=self.interval, since=since, limit=self.limit)
+            except Exception as e:
+                if i == self.retries:
+                    raise
+                print('获取K线报错，1s后重试', symbol, e)
+                time.sleep(1)
+
+    def since(self, symbol, start=None) -> int:
+        """
+        下载的开始时间, 毫秒时间戳.
+        存储中已有数据时从最新的一根K线开始, 这根K线下载时可能还没有走完, 需要重新下载.
+        往前多取一小时, 避免夏令时切换时本地时间转换为时间戳有一小时的偏差而漏掉K线.
+        """
+        last = self.store.last_time(symbol, self.interval)
+        if last is not None:
+            since = datetime_to_timestamp(last) - 3600 * 1000
+            return since if start is None else max(since, datetime_to_timestamp(start))
+        return 0 if start is None else datetime_to_timestamp(start)
+
+    def download(self, symbol, start=None, end=None) -> int:
+        """
+        下载一个交易对的K线, 从 since(symbol, start) 开始直到没有新的K线或者到达 end.
+        :param symbol: 交易对
+        :param start: 存储中没有数据时的开始时间, 本地时间, None 表示从最早的K线开始
+        :param end: 结束时间, 本地时间, 不包含 end, None 表示下载到最新的K线
+        :return: 下载的K线数量
+        """
+        since = self.since(symbol, start)
+        end = None if end is None else datetime_to_timestamp(end)
+
+        pages = []
+        buffered = 0
+        count = 0
+        try:
+            while end is None or since < end:
+                rows = [row for row in self.fetch(symbol, since) or []
+                        if row[0] >= since and (end is None or row[0] < end)]
+                if not rows:
+                    break
+
+                pages.append(rows)
+                buffered += len(rows)
+                count += len(rows)
+                since = int(rows[-1][0]) + 1
+
+                if buffered >= self.flush_rows:
+                    self.flush(symbol, pages)
+                    pages = []
+                    buffered = 0
+        finally:
+            # 出错或中断时也写入已下载的K线, 下次从这里继续
+            self.flush(symbol, pages)
+        return count
+
+    def flush(self, symbol, pages):
+        """
+        把下载的K线写入存储.
+        """
+        if pages:
+            self.store.append(symbol, ohlcv_to_dataframe([row for rows in pages for row in rows]), self.interval)
+
+    def download_all(self, symbols, start=None, end=None, max_workers=4) -> dict:
+        """
+        并发下载多个交易对的K线, 所有线程共用一个请求限速.
+        :param symbols: 交易对列表
+        :param start: 同 download
+        :param end: 同 download
+        :param max_workers: 线程数
+        :return: {交易对: 下载的K线数量}
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {symbol: executor.submit(self.download, symbol, start, end) for symbol in symbols}
+        return {symbol: future.result() for symbol, future in futures.items()}